@@ -0,0 +1,253 @@
+### --- Benchmark: SOLID payment pipeline variants --- ###
+
+# The repository has five versions of the same payment flow:
+# - a_initial_code.PaymentProcessor   (everything in one class)
+# - b_srp.PaymentService              (Single Responsibility)
+# - c_ocp.PaymentService              (Open/Closed)
+# - f_dip.PaymentService              (Dependency Inversion)
+# - strategy.PaymentService           (Strategy pattern, notification only)
+# - builder.PaymentServiceBuilder      (same stages as f_dip, compiled into one function)
+# This script runs all of them on the same synthetic workloads and measures what each
+# layer of abstraction costs.
+
+# For every variant and workload size it reports:
+# - throughput (transactions per second)
+# - p50 / p99 latency of a single transaction (microseconds)
+# - peak_bytes_per_tx: memory allocated at the peak of one transaction (tracemalloc, sampled)
+# - retained_bytes_per_tx: memory still held after the run, divided by the transactions
+
+# stdout and transactions.log are stubbed out: print goes to a null stream, events (events.py)
+# go to a sink whose handler writes nothing, and the `open` used by the loggers is replaced
+# with an in-memory file, so the numbers are not disk bound.
+
+# The workload is seeded, so two runs on two commits use exactly the same transactions.
+# Results are saved as JSON; --compare prints the throughput change against a saved run.
+
+# Usage:
+#   python benchmarks/payment_variants.py --sizes 1000 10000 --output bench.json
+#   python benchmarks/payment_variants.py --compare bench.json
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "design-principles", "solid"))
+sys.path.insert(0, os.path.join(ROOT, "design-patterns"))
+
+import a_initial_code
+import b_srp
+import builder
+import c_ocp
+import events
+import f_dip
+import strategy
+
+SOURCES = ("tok_mastercard", "tok_visa", "tok_amex", "btok_transfer")
+
+
+class NullStream(io.TextIOBase):
+    def write(self, text):
+        return len(text)
+
+
+def null_open(*args, **kwargs):
+    return io.StringIO()
+
+
+# Every customer has an email, the channel that every variant supports.
+def make_workload(size, seed):
+    rng = random.Random(seed)
+    workload = []
+    for number in range(size):
+        customer_data = {
+            "name": f"Customer {number}",
+            "contact_info": {"email": f"customer{number}@mail.com"},
+        }
+        payment_data = {
+            "amount": rng.randint(1, 100_000),
+            "source": rng.choice(SOURCES),
+            "cvv": rng.randint(100, 999),
+        }
+        workload.append((customer_data, payment_data))
+    return workload
+
+
+def build_variants():
+    initial = a_initial_code.PaymentProcessor()
+    srp = b_srp.PaymentService()
+    ocp = c_ocp.PaymentService()
+    dip = f_dip.PaymentService(
+        customer_validator=b_srp.CustomerValidation(),
+        payment_validator=b_srp.PaymentDataValidation(),
+        logger=b_srp.TransactionLogger(),
+        payment_processor=c_ocp.CreditCardPaymentProcessor(),
+        notifier=c_ocp.EmailNotifier(),
+    )
+
+    built = (
+        builder.PaymentServiceBuilder()
+        .with_customer_validator(b_srp.CustomerValidation())
+        .with_payment_validator(b_srp.PaymentDataValidation())
+        .with_processor(c_ocp.CreditCardPaymentProcessor())
+        .with_notifier(c_ocp.EmailNotifier())
+        .with_logger(b_srp.TransactionLogger())
+        .build()
+    )
+
+    def run_strategy(customer_data, payment_data):
+        strategy.PaymentService(strategy.set_notifier(customer_data)).process_transaction(customer_data)
+
+    return {
+        "a_initial_code": initial.process_transaction,
+        "b_srp": srp.process_transaction,
+        "c_ocp": ocp.process_transaction,
+        "f_dip": dip.process_transaction,
+        "builder": built.process_transaction,
+        "strategy": run_strategy,
+    }
+
+
+@contextlib.contextmanager
+def stubbed_io():
+    # Replaces the `open` that the loggers look up in their module globals.
+    modules = (a_initial_code, b_srp)
+    for module in modules:
+        module.open = null_open
+    previous_sink = events.set_sink(events.EventSink(handler=events.NullEventHandler()))
+    try:
+        with contextlib.redirect_stdout(NullStream()):
+            yield
+    finally:
+        events.set_sink(previous_sink).close()
+        for module in modules:
+            del module.open
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(run, workload, memory_samples):
+    latencies = []
+    perf_counter_ns = time.perf_counter_ns
+    started = perf_counter_ns()
+    for customer_data, payment_data in workload:
+        before = perf_counter_ns()
+        run(customer_data, payment_data)
+        latencies.append(perf_counter_ns() - before)
+    elapsed = (perf_counter_ns() - started) / 1e9
+    latencies.sort()
+
+    # Memory is measured in a separate pass, tracemalloc slows every allocation down.
+    sample = workload[:memory_samples]
+    # The events waiting in the sink's buffer are not the pipeline's memory: it is flushed
+    # before each reading of the traced memory.
+    sink = events.get_sink()
+    tracemalloc.start()
+    sink.flush()
+    baseline = tracemalloc.get_traced_memory()[0]
+    peaks = []
+    for customer_data, payment_data in sample:
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        run(customer_data, payment_data)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    sink.flush()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    return {
+        "throughput": len(workload) / elapsed,
+        "p50_us": percentile(latencies, 0.50) / 1000,
+        "p99_us": percentile(latencies, 0.99) / 1000,
+        "peak_bytes_per_tx": sum(peaks) / len(peaks) if peaks else 0.0,
+        "retained_bytes_per_tx": retained / len(sample) if sample else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, seed, variants=None, memory_samples=1000, warmup=200):
+    all_variants = build_variants()
+    selected = {name: all_variants[name] for name in (variants or all_variants)}
+
+    results = []
+    with stubbed_io():
+        for size in sizes:
+            workload = make_workload(size, seed)
+            for name, run in selected.items():
+                for customer_data, payment_data in workload[:warmup]:
+                    run(customer_data, payment_data)
+                results.append({"variant": name, "size": size, **measure(run, workload, memory_samples)})
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "timestamp": time.time(),
+        "results": results,
+    }
+
+
+def print_report(report, baseline=None):
+    previous = {}
+    if baseline:
+        previous = {(row["variant"], row["size"]): row for row in baseline["results"]}
+
+    print(f"{'variant':<16}{'size':>9}{'tx/s':>12}{'p50 us':>9}{'p99 us':>9}{'peak B/tx':>11}{'held B/tx':>11}")
+    for row in report["results"]:
+        line = (
+            f"{row['variant']:<16}{row['size']:>9}{row['throughput']:>12.0f}"
+            f"{row['p50_us']:>9.2f}{row['p99_us']:>9.2f}"
+            f"{row['peak_bytes_per_tx']:>11.0f}{row['retained_bytes_per_tx']:>11.1f}"
+        )
+        old = previous.get((row["variant"], row["size"]))
+        if old:
+            change = (row["throughput"] / old["throughput"] - 1) * 100
+            line += f"  {change:+.1f}% tx/s"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SOLID payment pipeline variants.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--variants", nargs="+", choices=list(build_variants()))
+    parser.add_argument("--memory-samples", type=int, default=1000)
+    parser.add_argument("--output", help="save the results as JSON to this path")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, args.seed, args.variants, args.memory_samples)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+### --- Soak test: payment pipeline over hours --- ###
+
+# payment_variants.py runs for seconds. A leak of a few bytes per transaction, or a cache
+# that is never trimmed, only shows after millions of transactions.
+
+# soak.py drives one of the payment_variants.py variants (f_dip by default) with the
+# workload of workload.py, at a target rate (or as fast as it can), for --duration seconds.
+# Every --interval seconds it records a sample:
+# - throughput of the interval (transactions per second) and failures so far
+# - rss_bytes: resident memory of the process (from /proc on Linux, the peak elsewhere)
+# - traced_bytes: memory allocated by Python and still alive (only with --tracemalloc,
+#   which slows every allocation down)
+# At the end it prints the growth per hour of rss and traced memory (least squares over the
+# samples, the first one is the warm-up), the throughput drift between the first and the
+# last interval, and with --tracemalloc the lines whose allocations grew the most.
+
+# I/O is stubbed like in payment_variants.py, so the memory measured is the pipeline's own.
+# The events still waiting in the event sink's buffer are written (to the null handler) before
+# every sample and snapshot, so the backlog of the sink is not mistaken for growth.
+# Invalid records raise in the validators: they are counted as failures, as in production.
+
+# Usage:
+#   python benchmarks/soak.py --variant f_dip --duration 14400 --rate 2000 --output soak.jsonl
+#   python benchmarks/soak.py --duration 600 --interval 30 --tracemalloc --top 10
+
+import argparse
+import itertools
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+from payment_variants import build_variants, stubbed_io
+from workload import WorkloadConfig, generate
+import events
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Slope of the least squares line through (x, y), in y units per x unit.
+def slope(xs, ys):
+    if len(xs) < 2:
+        return 0.0
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if not variance:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+
+def soak(run, records, duration, rate=0, interval=60.0, trace=False, on_sample=None):
+    # The first record is taken before tracing starts: the customer population that the
+    # generator builds then is set up once, it is not growth.
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return [], []
+    records = itertools.chain([first], records)
+
+    if trace:
+        tracemalloc.start()
+        events.get_sink().flush()
+        first_snapshot = tracemalloc.take_snapshot()
+
+    samples = []
+    processed = failed = 0
+    check_every = max(1, int(rate / 100)) if rate else 256
+    started = last_report = time.perf_counter()
+    reported = 0
+
+    for customer_data, payment_data in records:
+        try:
+            run(customer_data, payment_data)
+        except Exception:
+            failed += 1
+        processed += 1
+
+        if processed % check_every:
+            continue
+        now = time.perf_counter()
+        if rate:
+            ahead = started + processed / rate - now
+            if ahead > 0:
+                time.sleep(ahead)
+                now = time.perf_counter()
+        if now - last_report >= interval:
+            events.get_sink().flush()
+            sample = {
+                "elapsed": now - started,
+                "processed": processed,
+                "failed": failed,
+                "throughput": (processed - reported) / (now - last_report),
+                "rss_bytes": rss_bytes(),
+            }
+            if trace:
+                sample["traced_bytes"] = tracemalloc.get_traced_memory()[0]
+            samples.append(sample)
+            if on_sample:
+                on_sample(sample)
+            last_report, reported = now, processed
+        if now - started >= duration:
+            break
+
+    growth = []
+    if trace:
+        events.get_sink().flush()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        growth = snapshot.compare_to(first_snapshot, "lineno")
+        tracemalloc.stop()
+    return samples, growth
+
+
+def summarize(samples):
+    steady = samples[1:] if len(samples) > 2 else samples
+    hours = [sample["elapsed"] / 3600 for sample in steady]
+    summary = {
+        "samples": len(samples),
+        "rss_growth_bytes_per_hour": slope(hours, [sample["rss_bytes"] for sample in steady]),
+        "throughput_drift_percent": 0.0,
+    }
+    if "traced_bytes" in samples[0]:
+        summary["traced_growth_bytes_per_hour"] = slope(hours, [sample["traced_bytes"] for sample in steady])
+    if len(steady) >= 2:
+        summary["throughput_drift_percent"] = (steady[-1]["throughput"] / steady[0]["throughput"] - 1) * 100
+    return summary
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a payment pipeline variant for a long time and track its memory.")
+    parser.add_argument("--variant", default="f_dip", choices=list(build_variants()))
+    parser.add_argument("--duration", type=float, default=3600, help="seconds")
+    parser.add_argument("--rate", type=float, default=0, help="target transactions per second (0: as fast as possible)")
+    parser.add_argument("--interval", type=float, default=60, help="seconds between samples")
+    parser.add_argument("--tracemalloc", action="store_true", help="also track Python allocations")
+    parser.add_argument("--top", type=int, default=10, help="lines with the largest allocation growth to print")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--invalid-rate", type=float, default=0.01)
+    parser.add_argument("--channel-mix", type=parse_mix, default={"email": 1.0},
+                        help="e.g. email=0.7,phone=0.3 (the default: every variant supports email)")
+    parser.add_argument("--output", help="write every sample to this JSONL file")
+    args = parser.parse_args(argv)
+
+    config = WorkloadConfig(
+        seed=args.seed,
+        customers=args.customers,
+        skew=args.skew,
+        invalid_rate=args.invalid_rate,
+        channel_mix=args.channel_mix,
+    )
+    output = open(args.output, "w") if args.output else None
+
+    def report(sample):
+        line = (
+            f"{sample['elapsed']:>9.0f}s {sample['processed']:>12} tx {sample['throughput']:>10.0f} tx/s"
+            f" rss {sample['rss_bytes'] / 2**20:>8.1f} MiB"
+        )
+        if "traced_bytes" in sample:
+            line += f" traced {sample['traced_bytes'] / 2**20:>8.1f} MiB"
+        print(line, file=sys.stderr)
+        if output:
+            output.write(json.dumps(sample) + "\n")
+            output.flush()
+
+    run = build_variants()[args.variant]
+    try:
+        with stubbed_io():
+            samples, growth = soak(
+                run, generate(config), args.duration, args.rate, args.interval, args.tracemalloc, report
+            )
+    finally:
+        if output:
+            output.close()
+
+    if not samples:
+        print("No sample recorded: --duration is shorter than --interval", file=sys.stderr)
+        return
+    summary = summarize(samples)
+    print(f"rss growth: {summary['rss_growth_bytes_per_hour'] / 2**20:+.2f} MiB/hour")
+    if "traced_growth_bytes_per_hour" in summary:
+        print(f"traced growth: {summary['traced_growth_bytes_per_hour'] / 2**20:+.2f} MiB/hour")
+    print(f"throughput drift: {summary['throughput_drift_percent']:+.1f}%")
+    for stat in growth[:args.top]:
+        print(stat)
+
+
+if __name__ == "__main__":
+    main()
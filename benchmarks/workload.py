@@ -0,0 +1,139 @@
+### --- Synthetic payment workload --- ###
+
+# The only test data in the repository are the two customers of the __main__ demos.
+# generate() streams as many (customer_data, payment_data) records as needed, in the same
+# format as those demos, from a WorkloadConfig:
+# - customers: size of the customer population; `skew` makes a few customers pay much more
+#   often than the others (Zipf: customer k is chosen with weight 1 / k**skew, 0 = uniform)
+# - channel_mix: share of customers reached by email, by phone, or with both
+# - amounts: lognormal around amount_median (amount_sigma = spread), or uniform between
+#   amount_min and amount_max; always in minor units and at least 1
+# - source_mix / currency_mix: weights of the payment sources and currencies
+# - invalid_rate: share of records that the validators must reject (no name, no contact
+#   info or no source)
+
+# The same seed always gives the same customers and the same records, and records are
+# produced one chunk at a time, so a run of hours does not keep its workload in memory.
+
+# Usage:
+#   python benchmarks/workload.py --count 100000 --skew 1.1 > payments.jsonl
+# The JSONL output is the format of design-principles/solid/ingest.py.
+
+import argparse
+import itertools
+import json
+import math
+import random
+import sys
+from dataclasses import dataclass, field
+
+INVALID_KINDS = ("missing_name", "missing_contact_info", "missing_source")
+
+
+@dataclass
+class WorkloadConfig:
+    seed: int = 42
+    customers: int = 10_000
+    skew: float = 1.0
+    channel_mix: dict = field(default_factory=lambda: {"email": 0.7, "phone": 0.25, "both": 0.05})
+    amount_distribution: str = "lognormal"
+    amount_median: int = 2_500
+    amount_sigma: float = 1.0
+    amount_min: int = 100
+    amount_max: int = 100_000
+    source_mix: dict = field(default_factory=lambda: {
+        "tok_mastercard": 0.4, "tok_visa": 0.4, "tok_amex": 0.1, "btok_transfer": 0.1,
+    })
+    currency_mix: dict = field(default_factory=lambda: {"usd": 1.0})
+    invalid_rate: float = 0.01
+
+
+def _cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+def make_customers(config, rng):
+    channels = list(config.channel_mix)
+    channel_weights = _cumulative(config.channel_mix.values())
+    customers = []
+    for number in range(config.customers):
+        channel = rng.choices(channels, cum_weights=channel_weights)[0]
+        contact_info = {}
+        if channel in ("email", "both"):
+            contact_info["email"] = f"customer{number}@mail.com"
+        if channel in ("phone", "both"):
+            contact_info["phone"] = f"555{number:07d}"
+        customers.append({"id": f"cus_{number}", "name": f"Customer {number}", "contact_info": contact_info})
+    return customers
+
+
+def _amounts(config, rng):
+    if config.amount_distribution == "uniform":
+        return lambda: rng.randint(config.amount_min, config.amount_max)
+    if config.amount_distribution == "lognormal":
+        mu = math.log(config.amount_median)
+        return lambda: max(1, int(rng.lognormvariate(mu, config.amount_sigma)))
+    raise ValueError(f"Unknown amount distribution: {config.amount_distribution}")
+
+
+def _invalid(customer_data, payment_data, kind):
+    if kind == "missing_name":
+        customer_data = {**customer_data, "name": ""}
+    elif kind == "missing_contact_info":
+        customer_data = {**customer_data, "contact_info": {}}
+    else:
+        payment_data = {**payment_data, "source": None}
+    return customer_data, payment_data
+
+
+# Yields `count` records (forever when count is None).
+def generate(config=None, count=None, chunk_size=1024):
+    config = config or WorkloadConfig()
+    rng = random.Random(config.seed)
+    customers = make_customers(config, rng)
+    customer_weights = _cumulative(1 / rank ** config.skew for rank in range(1, len(customers) + 1))
+    sources = list(config.source_mix)
+    source_weights = _cumulative(config.source_mix.values())
+    currencies = list(config.currency_mix)
+    currency_weights = _cumulative(config.currency_mix.values())
+    amount = _amounts(config, rng)
+
+    produced = 0
+    while count is None or produced < count:
+        size = chunk_size if count is None else min(chunk_size, count - produced)
+        chosen = rng.choices(customers, cum_weights=customer_weights, k=size)
+        chosen_sources = rng.choices(sources, cum_weights=source_weights, k=size)
+        chosen_currencies = rng.choices(currencies, cum_weights=currency_weights, k=size)
+        for customer_data, source, currency in zip(chosen, chosen_sources, chosen_currencies):
+            payment_data = {"amount": amount(), "source": source, "currency": currency}
+            if rng.random() < config.invalid_rate:
+                yield _invalid(customer_data, payment_data, rng.choice(INVALID_KINDS))
+            else:
+                yield customer_data, payment_data
+        produced += size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic payment workload as JSONL.")
+    parser.add_argument("--count", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--customers", type=int, default=10_000)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--invalid-rate", type=float, default=0.01)
+    parser.add_argument("--amounts", choices=("lognormal", "uniform"), default="lognormal")
+    args = parser.parse_args(argv)
+
+    config = WorkloadConfig(
+        seed=args.seed,
+        customers=args.customers,
+        skew=args.skew,
+        invalid_rate=args.invalid_rate,
+        amount_distribution=args.amounts,
+    )
+    write = sys.stdout.write
+    for customer_data, payment_data in generate(config, args.count):
+        write(json.dumps({"customer": customer_data, "payment": payment_data}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,3 +10,136 @@
 # - Separate the construction in a builder class.
 # - Create methods in the builder class to set the properties of the object.
 # - Create a build method that returns the final object.
+
+# Example: PaymentServiceBuilder builds a payment pipeline step by step.
+# Every PaymentService variant runs its stages through try/except blocks that only re-raise,
+# and looks up self.<dependency>.<method> on every call. The builder does that work once:
+# - stages that are not set (or are None) are dropped, so a pipeline for internal transfers
+#   can simply have no notifier
+# - the remaining stages are fused into a single generated function, the methods are bound
+#   when the pipeline is built and the function calls them directly
+# - the result is an immutable PaymentPipeline (frozen dataclass), a different shape only
+#   needs a different chain of builder calls
+
+from dataclasses import dataclass, field
+
+
+@dataclass(frozen=True)
+class PaymentPipeline:
+		stages: tuple
+		process_transaction: object = field(repr=False)
+
+
+class PaymentServiceBuilder:
+		def __init__(self):
+				self._customer_validator = None
+				self._payment_validator = None
+				self._processor = None
+				self._notifier = None
+				self._logger = None
+
+		def with_customer_validator(self, validator):
+				self._customer_validator = validator
+				return self
+
+		def with_payment_validator(self, validator):
+				self._payment_validator = validator
+				return self
+
+		def with_processor(self, processor):
+				self._processor = processor
+				return self
+
+		def with_notifier(self, notifier):
+				self._notifier = notifier
+				return self
+
+		def with_logger(self, logger):
+				self._logger = logger
+				return self
+
+		def build(self) -> PaymentPipeline:
+				if self._processor is None:
+						raise ValueError("A payment pipeline needs a processor")
+
+				# (name, bound method or None, line of the generated function)
+				stages = (
+						("customer_validation", self._customer_validator and self._customer_validator.validate,
+								"    customer_validation(customer_data)"),
+						("payment_validation", self._payment_validator and self._payment_validator.validate,
+								"    payment_validation(payment_data)"),
+						("charge", self._processor.process_transaction,
+								"    charge = charge_stage(customer_data, payment_data)"),
+						("notification", self._notifier and self._notifier.send_confirmation,
+								"    notification(customer_data)"),
+						("logging", self._logger and self._logger.log,
+								"    logging(customer_data, payment_data, charge)"),
+				)
+				stages = tuple(stage for stage in stages if stage[1] is not None)
+
+				namespace = {}
+				for name, method, _ in stages:
+						namespace["charge_stage" if name == "charge" else name] = method
+				source = "\n".join(
+						["def process_transaction(customer_data, payment_data):"]
+						+ [line for _, _, line in stages]
+						+ ["    return charge"]
+				)
+				exec(source, namespace)
+
+				return PaymentPipeline(
+						stages=tuple(name for name, _, _ in stages),
+						process_transaction=namespace["process_transaction"],
+				)
+
+
+if __name__ == "__main__":
+		import os
+		import sys
+
+		sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "design-principles", "solid"))
+		from b_srp import CustomerValidation, PaymentDataValidation, TransactionLogger
+		from c_ocp import CreditCardPaymentProcessor, EmailNotifier, SMSNotifier
+
+		customer_data_with_email = {
+				"name": "John Doe",
+				"contact_info": {"email": "e@mail.com"},
+		}
+		customer_data_with_phone = {
+				"name": "Python SPR",
+				"contact_info": {"phone": "1234567890"},
+		}
+		payment_data = {"amount": 500, "source": "tok_mastercard", "cvv": 123}
+
+		payment_service_with_email = (
+				PaymentServiceBuilder()
+				.with_customer_validator(CustomerValidation())
+				.with_payment_validator(PaymentDataValidation())
+				.with_processor(CreditCardPaymentProcessor())
+				.with_notifier(EmailNotifier())
+				.with_logger(TransactionLogger())
+				.build()
+		)
+		payment_service_with_email.process_transaction(customer_data_with_email, payment_data)
+
+		payment_service_with_phone = (
+				PaymentServiceBuilder()
+				.with_customer_validator(CustomerValidation())
+				.with_payment_validator(PaymentDataValidation())
+				.with_processor(CreditCardPaymentProcessor())
+				.with_notifier(SMSNotifier())
+				.with_logger(TransactionLogger())
+				.build()
+		)
+		payment_service_with_phone.process_transaction(customer_data_with_phone, payment_data)
+
+		# Internal transfer: no notification stage at all.
+		internal_transfer = (
+				PaymentServiceBuilder()
+				.with_payment_validator(PaymentDataValidation())
+				.with_processor(CreditCardPaymentProcessor())
+				.with_logger(TransactionLogger())
+				.build()
+		)
+		print(internal_transfer.stages)
+		internal_transfer.process_transaction({"name": "Treasury"}, payment_data)
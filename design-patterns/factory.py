@@ -12,3 +12,180 @@
 
 # How to implement:
 # - Create factory class that creates objects based on input.
+
+# Example: PaymentProcessorFactory creates the payment processor from payment_data["source"].
+# The callers do not choose CreditCardPaymentProcessor or TransferTransactionProcessor (e_isp.py)
+# by hand, the factory looks the source up in a table of prefixes:
+#   "tok_"  -> credit cards (tok_mastercard, tok_visa, ...)
+#   "btok_" -> bank transfers
+# The longest matching prefix wins. The route only depends on the first characters of the
+# source (as many as the longest registered prefix), so the result is cached under those
+# characters, not under the whole source: bank-transfer tokens are unique per transfer, but they
+# all share a handful of leading characters. The cache is also an LRU of at most max_resolved
+# entries, so it stays bounded whatever the sources look like.
+
+# Processors are pooled instead of built per request:
+# - a processor is only built the first time its route is used (lazy), by the route's constructor,
+#   which is where gateway sessions and configuration are set up; if it has a warm() method it
+#   is called once, before the processor is handed out
+# - at most max_pool_size processors exist per route; when they are all in use, acquire()
+#   waits up to acquire_timeout seconds for one to be released, then raises TimeoutError
+# - prewarm() builds processors ahead of time, so the first requests do not pay the setup cost
+
+# The factory is a PaymentProcessor itself (process_transaction), so it can be given to
+# PaymentService in place of a single processor.
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from queue import Empty, SimpleQueue
+
+
+@dataclass
+class _Pool:
+		constructor: object
+		idle: SimpleQueue = field(default_factory=SimpleQueue)
+		created: int = 0
+
+
+@dataclass
+class PaymentProcessorFactory:
+		routes: dict = field(default_factory=dict)
+		max_pool_size: int = 8
+		acquire_timeout: float = None
+		max_resolved: int = 1024
+
+		_pools: dict = field(init=False, repr=False, default_factory=dict)
+		_resolved: OrderedDict = field(init=False, repr=False, default_factory=OrderedDict)
+		_key_length: int = field(init=False, repr=False, default=0)
+		_owners: dict = field(init=False, repr=False, default_factory=dict)
+		_lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+
+		def __post_init__(self):
+				routes, self.routes = self.routes, {}
+				for prefix, constructor in routes.items():
+						self.register(prefix, constructor)
+
+		# constructor is a class or any callable returning a processor.
+		def register(self, prefix, constructor):
+				with self._lock:
+						self.routes[prefix] = constructor
+						self._pools[prefix] = _Pool(constructor)
+						self._key_length = max(self._key_length, len(prefix))
+						self._resolved.clear()
+				return self
+
+		def resolve(self, source):
+				key = source[:self._key_length]
+				with self._lock:
+						prefix = self._resolved.get(key)
+						if prefix is not None:
+								self._resolved.move_to_end(key)
+								return prefix
+
+				matches = [prefix for prefix in self.routes if key.startswith(prefix)]
+				if not matches:
+						raise ValueError(f"No payment processor for source {source!r}")
+				prefix = max(matches, key=len)
+				with self._lock:
+						self._resolved[key] = prefix
+						if len(self._resolved) > self.max_resolved:
+								self._resolved.popitem(last=False)
+				return prefix
+
+		def acquire(self, source):
+				pool = self._pools[self.resolve(source)]
+				try:
+						return pool.idle.get_nowait()
+				except Empty:
+						pass
+
+				with self._lock:
+						build = pool.created < self.max_pool_size
+						if build:
+								pool.created += 1
+				if build:
+						try:
+								return self._build(pool)
+						except Exception:
+								with self._lock:
+										pool.created -= 1
+								raise
+
+				try:
+						return pool.idle.get(timeout=self.acquire_timeout)
+				except Empty:
+						raise TimeoutError(f"No payment processor available for source {source!r}") from None
+
+		def release(self, processor):
+				self._owners[id(processor)].idle.put(processor)
+
+		@contextmanager
+		def processor(self, source):
+				processor = self.acquire(source)
+				try:
+						yield processor
+				finally:
+						self.release(processor)
+
+		# Builds processors for a source until its pool holds `count` of them (max_pool_size at most).
+		def prewarm(self, source, count=1):
+				pool = self._pools[self.resolve(source)]
+				built = []
+				while True:
+						with self._lock:
+								if pool.created >= min(count, self.max_pool_size):
+										break
+								pool.created += 1
+						built.append(self._build(pool))
+				for processor in built:
+						pool.idle.put(processor)
+
+		def process_transaction(self, customer_data, payment_data):
+				processor = self.acquire(payment_data["source"])
+				try:
+						return processor.process_transaction(customer_data, payment_data)
+				finally:
+						self.release(processor)
+
+		def _build(self, pool):
+				processor = pool.constructor()
+				warm = getattr(processor, "warm", None)
+				if warm is not None:
+						warm()
+				self._owners[id(processor)] = pool
+				return processor
+
+
+if __name__ == "__main__":
+		import os
+		import sys
+
+		sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "design-principles", "solid"))
+		from e_isp import CreditCardPaymentProcessor, TransferTransactionProcessor
+
+		processor_factory = PaymentProcessorFactory(
+				routes={
+						"tok_": CreditCardPaymentProcessor,
+						"btok_": TransferTransactionProcessor,
+				},
+				max_pool_size=4,
+		)
+		processor_factory.prewarm("tok_mastercard", count=2)
+
+		customer_data = {"name": "John Doe", "contact_info": {"email": "e@mail.com"}}
+		for source in ("tok_mastercard", "tok_visa", "btok_1f3a9c", "btok_77d2e0"):
+				with processor_factory.processor(source) as processor:
+						print(source, "->", type(processor).__name__)
+				processor_factory.process_transaction(customer_data, {"amount": 500, "source": source})
+
+		try:
+				processor_factory.process_transaction(customer_data, {"amount": 500, "source": "cash"})
+		except ValueError as e:
+				print(e)
+
+		# Every transfer has its own token, the cache only holds their common leading characters.
+		for number in range(10_000):
+				processor_factory.resolve(f"btok_{number:08x}")
+		print(len(processor_factory._resolved), "cached route(s)")
@@ -4,7 +4,18 @@
 # and makes them interchangeable.
 
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+# The notifiers report through the event sink of the SOLID examples (events.py), like those of
+# c_ocp.py, when it can be imported (the benchmarks put design-principles/solid on sys.path).
+# On its own, this example prints the same text.
+try:
+		from events import emit, INFO
+except ImportError:
+		INFO = 20
+
+		def emit(level, name, message, **fields):
+				print(message.format(**fields))
 
 class Notifier(ABC):
 		@abstractmethod
@@ -18,13 +29,17 @@ class EmailNotifier(Notifier):
 				msg["From"] = "no-reply@example.com"
 				msg["To"] = customer_data["contact_info"]["email"]
 
-				print("Email sent to", customer_data["contact_info"]["email"])
+				emit(INFO, "email_sent", "Email sent to {email}", email=customer_data["contact_info"]["email"])
                                 
 class SMSNotifier(Notifier):
 		def send_confirmation(self, customer_data):
 				phone_number = customer_data["contact_info"]["phone"]
 				sms_gateway = "the custom SMS Gateway"
-				print(f"send the sms using {sms_gateway}: SMS sent to {phone_number}: Thank you for your payment.")
+				emit(
+						INFO, "sms_sent",
+						"send the sms using {gateway}: SMS sent to {phone}: Thank you for your payment.",
+						gateway=sms_gateway, phone=phone_number,
+				)
 
 @dataclass
 class PaymentService:
@@ -44,7 +59,48 @@ def set_notifier(customer_data) -> Notifier:
 				return SMSNotifier()
 		
 		raise ValueError("Invalid contact info")
-		
+
+# Routing registry for the strategies above.
+# set_notifier creates a new notifier for every customer, but the notifiers have no state,
+# so one shared instance per channel is enough (Flyweight).
+# Channels are registered in priority order (first match wins), so a new channel is added
+# with register() instead of editing an if-chain.
+# The channel chosen for each shape of contact_info (its set of keys) is cached, so routing a
+# customer is a single dict lookup after the first time a shape is seen.
+@dataclass
+class NotifierRegistry:
+		channels: list = field(default_factory=list)
+		_routes: dict = field(default_factory=dict, init=False, repr=False)
+
+		def register(self, contact_key, notifier: Notifier):
+				self.channels.append((contact_key, notifier))
+				self._routes.clear()
+
+		def route(self, customer_data) -> Notifier:
+				shape = frozenset(customer_data["contact_info"])
+				try:
+						return self._routes[shape]
+				except KeyError:
+						pass
+
+				for contact_key, notifier in self.channels:
+						if contact_key in shape:
+								self._routes[shape] = notifier
+								return notifier
+
+				raise ValueError("Invalid contact info")
+
+		# Splits a batch of customers into {notifier: [customers]} in one pass.
+		def group(self, customers):
+				groups = {}
+				for customer_data in customers:
+						groups.setdefault(self.route(customer_data), []).append(customer_data)
+				return groups
+
+notifier_registry = NotifierRegistry()
+notifier_registry.register("email", EmailNotifier())
+notifier_registry.register("phone", SMSNotifier())
+
 if __name__ == "__main__":
 		customer_data_with_email = {
 				"name": "John Doe",
@@ -60,4 +116,10 @@ if __name__ == "__main__":
 
 		payment_service = PaymentService(set_notifier(customer_data_with_phone))
 		payment_service.process_transaction(customer_data_with_phone)
+
+		# With the registry the notifiers are shared, and a batch is grouped by channel.
+		for notifier, customers in notifier_registry.group([customer_data_with_email, customer_data_with_phone]).items():
+				payment_service = PaymentService(notifier)
+				for customer_data in customers:
+						payment_service.process_transaction(customer_data)
 		
\ No newline at end of file
@@ -0,0 +1,163 @@
+### --- Async Payment Service --- ###
+
+# PaymentProcessor and Notifier (c_ocp.py, strategy.py) are synchronous. When the processor
+# and the notifier are network calls, the thread that runs PaymentService waits idle on I/O.
+
+# Here the same abstractions are declared with async methods, so one event loop can keep
+# many transactions in flight. It is the same Dependency Inversion idea of f_dip.py:
+# AsyncPaymentService depends on AsyncPaymentProcessor and AsyncNotifier, not on details.
+
+# Sync implementations (CreditCardPaymentProcessor, the notifiers of c_ocp.py and strategy.py) plug in through
+# the adapters below (Adapter pattern). By default they run in a worker thread, so a
+# blocking call does not stop the event loop.
+
+# max_concurrency limits how many transactions are processed at the same time.
+
+# TransactionLogger writes to a file, which blocks: the log is written from a worker thread,
+# and process_batch writes all its charges with one log_batch call once they are done.
+
+import asyncio
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from b_srp import CustomerValidation, PaymentDataValidation, TransactionLogger
+from c_ocp import PaymentProcessor, Notifier
+from f_dip import TransactionResult
+
+
+class AsyncPaymentProcessor(ABC):
+    @abstractmethod
+    async def process_transaction(self, customer_data, payment_data):
+        ...
+
+
+class AsyncNotifier(ABC):
+    @abstractmethod
+    async def send_confirmation(self, customer_data):
+        ...
+
+
+@dataclass
+class SyncPaymentProcessorAdapter(AsyncPaymentProcessor):
+    processor: PaymentProcessor
+    in_thread: bool = True
+
+    async def process_transaction(self, customer_data, payment_data):
+        if self.in_thread:
+            return await asyncio.to_thread(
+                self.processor.process_transaction, customer_data, payment_data
+            )
+        return self.processor.process_transaction(customer_data, payment_data)
+
+
+@dataclass
+class SyncNotifierAdapter(AsyncNotifier):
+    notifier: Notifier
+    in_thread: bool = True
+
+    async def send_confirmation(self, customer_data):
+        if self.in_thread:
+            return await asyncio.to_thread(self.notifier.send_confirmation, customer_data)
+        return self.notifier.send_confirmation(customer_data)
+
+
+@dataclass
+class AsyncPaymentService:
+    customer_validator: CustomerValidation
+    payment_validator: PaymentDataValidation
+    logger: TransactionLogger
+    payment_processor: AsyncPaymentProcessor
+    notifier: AsyncNotifier
+    max_concurrency: int = 1000
+
+    _semaphore: asyncio.Semaphore = field(init=False, repr=False, default=None)
+
+    def __post_init__(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def process_transaction(self, customer_data, payment_data):
+        charge = await self._charge(customer_data, payment_data)
+        await asyncio.to_thread(self.logger.log, customer_data, payment_data, charge)
+        return charge
+
+    # Runs every pair concurrently (up to max_concurrency) and returns one
+    # TransactionResult per pair, in the same order as the input. As in f_dip, a failing
+    # log write is reported in the results of the charges it did not record.
+    async def process_batch(self, pairs):
+        pairs = list(pairs)
+
+        async def run(customer_data, payment_data):
+            try:
+                charge = await self._charge(customer_data, payment_data)
+            except Exception as e:
+                return TransactionResult(error=e)
+            return TransactionResult(charge=charge)
+
+        results = await asyncio.gather(
+            *(run(customer_data, payment_data) for customer_data, payment_data in pairs)
+        )
+
+        to_log = [
+            (customer_data, payment_data, result.charge)
+            for (customer_data, payment_data), result in zip(pairs, results)
+            if result.ok
+        ]
+        if to_log:
+            try:
+                await asyncio.to_thread(self.logger.log_batch, to_log)
+            except Exception as e:
+                for result in results:
+                    if result.ok:
+                        result.log_error = e
+        return results
+
+    async def _charge(self, customer_data, payment_data):
+        self.customer_validator.validate(customer_data)
+        self.payment_validator.validate(payment_data)
+
+        async with self._semaphore:
+            charge = await self.payment_processor.process_transaction(
+                customer_data, payment_data
+            )
+            await self.notifier.send_confirmation(customer_data)
+        return charge
+
+
+if __name__ == "__main__":
+    from c_ocp import CreditCardPaymentProcessor, EmailNotifier, SMSNotifier
+
+    class FakeGatewayProcessor(AsyncPaymentProcessor):
+        # Simulates a network round-trip to the payment gateway.
+        async def process_transaction(self, customer_data, payment_data):
+            await asyncio.sleep(0.1)
+            return await SyncPaymentProcessorAdapter(
+                CreditCardPaymentProcessor(), in_thread=False
+            ).process_transaction(customer_data, payment_data)
+
+    async def main():
+        payment_service = AsyncPaymentService(
+            customer_validator=CustomerValidation(),
+            payment_validator=PaymentDataValidation(),
+            logger=TransactionLogger(),
+            payment_processor=FakeGatewayProcessor(),
+            notifier=SyncNotifierAdapter(EmailNotifier()),
+            max_concurrency=100,
+        )
+
+        customer_data_with_email = {
+            "name": "John Doe",
+            "contact_info": {"email": "e@mail.com"},
+        }
+        payment_data = {"amount": 500, "source": "tok_mastercard", "cvv": 123}
+
+        # The ten gateway calls overlap, so this takes about 0.1s and not 1s.
+        results = await payment_service.process_batch(
+            [(customer_data_with_email, payment_data)] * 10
+        )
+        print(sum(result.ok for result in results), "transactions succeeded")
+
+        payment_service.notifier = SyncNotifierAdapter(SMSNotifier())
+        await payment_service.process_transaction(
+            {"name": "Python SPR", "contact_info": {"phone": "1234567890"}}, payment_data
+        )
+
+    asyncio.run(main())
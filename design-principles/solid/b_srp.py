@@ -20,17 +20,19 @@
 # and then see the spr apply in this file
 
 from dataclasses import dataclass
+from charge import Charge, Currency
+from events import emit, INFO, WARNING, ERROR
                 
 # Validation Responsibility
 @dataclass
 class CustomerValidation:
 		def validate(self, customer_data):
 				if not customer_data.get("name"):
-						print("Invalid customer data: missing name")
+						emit(WARNING, "invalid_customer", "Invalid customer data: missing name")
 						raise ValueError("Invalid customer data: missing name")
 
 				if not customer_data.get("contact_info"):
-						print("Invalid customer data: missing contact info")
+						emit(WARNING, "invalid_customer", "Invalid customer data: missing contact info")
 						raise ValueError("Invalid customer data: missing contact info")
 
 # Validation Responsibility                          
@@ -38,7 +40,7 @@ class CustomerValidation:
 class PaymentDataValidation:
 		def validate(self, payment_data):
 				if not payment_data.get("source"):
-						print("Invalid payment data")
+						emit(WARNING, "invalid_payment", "Invalid payment data")
 						raise ValueError("Invalid payment data")
                                 
 
@@ -58,39 +60,48 @@ class Notifier:
                 # server = smtplib.SMTP("localhost")
                 # server.send_message(msg)
                 # server.quit()
-                print("Email sent to", customer_data["contact_info"]["email"])
+                emit(INFO, "email_sent", "Email sent to {email}", email=customer_data["contact_info"]["email"])
 
             elif "phone" in customer_data["contact_info"]:
                 phone_number = customer_data["contact_info"]["phone"]
                 sms_gateway = "the custom SMS Gateway"
-                print(
-                    f"send the sms using {sms_gateway}: SMS sent to {phone_number}: Thank you for your payment."
+                emit(
+                    INFO, "sms_sent",
+                    "send the sms using {gateway}: SMS sent to {phone}: Thank you for your payment.",
+                    gateway=sms_gateway, phone=phone_number,
                 )
 
 # Logging Responsibility
+# The amount and currency are the charge's: what was actually charged, in the currency it was charged in.
 @dataclass
 class TransactionLogger:
         def log(self, customer_data, payment_data, charge):
             with open("transactions.log", "a") as log_file:
-                log_file.write(f"{customer_data['name']} paid {payment_data['amount']}\n")
+                log_file.write(f"{customer_data['name']} paid {charge['amount']} {charge['currency']}\n")
                 log_file.write(f"Payment status: {charge['status']}\n")
 
+        # Same records as log(), but the file is opened once for the whole batch.
+        def log_batch(self, entries):
+            with open("transactions.log", "a") as log_file:
+                for customer_data, payment_data, charge in entries:
+                    log_file.write(f"{customer_data['name']} paid {charge['amount']} {charge['currency']}\n")
+                    log_file.write(f"Payment status: {charge['status']}\n")
+
 
 # Payment Responsibility
 @dataclass
 class PaymentProcessor:
     def process_transaction(self, customer_data, payment_data):
         try:
-            charge = {
-                "amount": payment_data["amount"],
-                "currency": "usd",
-                "source": payment_data["source"],
-                "description": customer_data["name"],
-                "status": "succeeded",
-            }
-            print("Payment successful")
+            charge = Charge(
+                amount=payment_data["amount"],
+                source=payment_data["source"],
+                description=customer_data["name"],
+                currency=payment_data.get("currency", Currency.USD),
+            )
+            emit(INFO, "payment_succeeded", "Payment successful")
         except Exception as e:
-            print("Payment failed:", e)
+            emit(ERROR, "payment_failed", "Payment failed: {error}", error=e)
             raise e
 
         return charge
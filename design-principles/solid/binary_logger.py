@@ -0,0 +1,344 @@
+### --- Binary Transaction Log --- ###
+
+# transactions.log is free text ("X paid 500" / "Payment status: succeeded"), so reading it
+# back means parsing strings line by line.
+
+# BinaryTransactionLogger is another TransactionLogger backend. It writes one fixed-width
+# record per charge:
+# - customer id (customer_data["id"], or the name when there is no id), 32 bytes utf-8; a
+#   longer id is stored cut to 32 bytes (at a character boundary), the index keeps the hash of
+#   the whole id, so lookups still tell apart two customers with the same first 32 bytes
+# - amount, signed 64-bit integer
+# - currency, 3 bytes (e.g. b"usd")
+# - status, 1 byte code (see STATUSES)
+# - timestamp, 64-bit float (seconds since epoch)
+# Because every record has the same size, record n starts at HEADER_SIZE + n * RECORD_SIZE.
+
+# The sidecar index (<path>.idx) stores (customer hash, record number) for every record, in
+# the order they were written. When the logger is closed, it writes the sorted index
+# (<path>.sidx): the same entries sorted by customer hash, after a header with the number of
+# records it covers. Only the entries written since the previous close are sorted, in runs of
+# at most run_entries, and merged with the previous sorted index as streams, so closing never
+# holds the whole index in memory. The reader binary-searches the sorted index in place
+# through the mmap and only scans the part of <path>.idx written after it, so a lookup never
+# decodes the whole index into memory.
+
+# TransactionLogReader maps the files in memory (mmap) and offers:
+# - random access by record number: reader[n]
+# - lookup by customer: reader.by_customer("John Doe"), O(log n) in the sorted index
+# - sequential scans: for record in reader.scan()
+
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+import time
+from dataclasses import dataclass, field
+from b_srp import TransactionLogger
+
+MAGIC = b"TXLOG001"
+HEADER_SIZE = len(MAGIC)
+
+RECORD = struct.Struct("<32sq3sBd")
+RECORD_SIZE = RECORD.size
+
+INDEX_ENTRY = struct.Struct("<QQ")
+INDEX_KEY = struct.Struct("<Q")
+
+SORTED_MAGIC = b"TXIDX001"
+SORTED_HEADER = struct.Struct("<8sQ")
+
+CUSTOMER_ID_SIZE = 32
+
+STATUSES = ("succeeded", "failed", "pending", "refunded")
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+
+def customer_key(customer_id):
+    # Python's hash() changes between processes, the index needs a stable one.
+    return int.from_bytes(
+        hashlib.blake2b(customer_id.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+# The id as stored in a record: at most CUSTOMER_ID_SIZE bytes, cut at a character boundary.
+def _encode_customer_id(customer_id):
+    encoded = customer_id.encode("utf-8")
+    if len(encoded) > CUSTOMER_ID_SIZE:
+        encoded = encoded[:CUSTOMER_ID_SIZE].decode("utf-8", "ignore").encode("utf-8")
+    return encoded
+
+
+def _read_entries(file, start, count, block_entries=65536):
+    file.seek(start)
+    while count:
+        entries = min(count, block_entries)
+        yield from INDEX_ENTRY.iter_unpack(file.read(entries * INDEX_ENTRY.size))
+        count -= entries
+
+
+# Writes the sorted index of every entry of the index file: the entries added since the
+# previous sorted index are sorted in runs of run_entries (spilled to temporary files), then
+# merged with it. Written to a temporary file and renamed.
+def write_sorted_index(index_path, sorted_path, run_entries=1 << 18):
+    total = os.path.getsize(index_path) // INDEX_ENTRY.size
+    covered = 0
+    if os.path.exists(sorted_path) and os.path.getsize(sorted_path) >= SORTED_HEADER.size:
+        with open(sorted_path, "rb") as file:
+            magic, covered = SORTED_HEADER.unpack(file.read(SORTED_HEADER.size))
+        if magic != SORTED_MAGIC or covered > total:
+            covered = 0
+
+    runs = []
+    try:
+        with open(index_path, "rb") as index:
+            for start in range(covered, total, run_entries):
+                count = min(run_entries, total - start)
+                entries = sorted(_read_entries(index, start * INDEX_ENTRY.size, count))
+                run = tempfile.TemporaryFile()
+                run.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in entries))
+                runs.append((run, count))
+        del entries
+
+        streams = [_read_entries(run, 0, count) for run, count in runs]
+        previous = open(sorted_path, "rb") if covered else None
+        if previous is not None:
+            streams.append(_read_entries(previous, SORTED_HEADER.size, covered))
+
+        temporary = sorted_path + ".tmp"
+        try:
+            with open(temporary, "wb") as file:
+                file.write(SORTED_HEADER.pack(SORTED_MAGIC, total))
+                block = bytearray()
+                for entry in heapq.merge(*streams):
+                    block += INDEX_ENTRY.pack(*entry)
+                    if len(block) >= 1 << 20:
+                        file.write(block)
+                        block.clear()
+                file.write(block)
+        finally:
+            if previous is not None:
+                previous.close()
+        os.replace(temporary, sorted_path)
+    finally:
+        for run, _ in runs:
+            run.close()
+
+
+@dataclass
+class BinaryTransactionLogger(TransactionLogger):
+    path: str = "transactions.bin"
+    index_path: str = None
+    sorted_index_path: str = None
+
+    _file: object = field(init=False, repr=False, default=None)
+    _index_file: object = field(init=False, repr=False, default=None)
+    _next_record: int = field(init=False, repr=False, default=0)
+
+    def __post_init__(self):
+        if self.index_path is None:
+            self.index_path = self.path + ".idx"
+        if self.sorted_index_path is None:
+            self.sorted_index_path = self.path + ".sidx"
+
+        self._file = open(self.path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._next_record = (self._file.tell() - HEADER_SIZE) // RECORD_SIZE
+        self._index_file = open(self.index_path, "ab")
+
+    def log(self, customer_data, payment_data, charge):
+        self.log_batch([(customer_data, payment_data, charge)])
+
+    def log_batch(self, entries):
+        records = bytearray()
+        index_entries = bytearray()
+        now = time.time()
+        for customer_data, payment_data, charge in entries:
+            customer_id = customer_data.get("id", customer_data["name"])
+            try:
+                status = STATUS_CODES[charge["status"]]
+            except KeyError:
+                raise ValueError(f"Unknown charge status: {charge['status']}")
+
+            records += RECORD.pack(
+                _encode_customer_id(customer_id),
+                charge["amount"],
+                charge["currency"].encode("ascii"),
+                status,
+                now,
+            )
+            index_entries += INDEX_ENTRY.pack(customer_key(customer_id), self._next_record)
+            self._next_record += 1
+
+        self._file.write(records)
+        self._index_file.write(index_entries)
+        self._file.flush()
+        self._index_file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+        self._index_file.close()
+        write_sorted_index(self.index_path, self.sorted_index_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@dataclass
+class TransactionLogReader:
+    path: str = "transactions.bin"
+    index_path: str = None
+    sorted_index_path: str = None
+
+    _data: object = field(init=False, repr=False, default=None)
+    _index: object = field(init=False, repr=False, default=None)
+    _sorted: object = field(init=False, repr=False, default=b"")
+    _sorted_count: int = field(init=False, repr=False, default=0)
+
+    def __post_init__(self):
+        if self.index_path is None:
+            self.index_path = self.path + ".idx"
+        if self.sorted_index_path is None:
+            self.sorted_index_path = self.path + ".sidx"
+
+        self._data = self._map(self.path)
+        if self._data[:HEADER_SIZE] != MAGIC:
+            raise ValueError(f"Not a binary transaction log: {self.path}")
+        self._index = self._map(self.index_path)
+
+        # No sorted index (the logger was not closed yet): every lookup scans <path>.idx.
+        if os.path.exists(self.sorted_index_path):
+            self._sorted = self._map(self.sorted_index_path)
+            magic, count = SORTED_HEADER.unpack_from(self._sorted)
+            if magic != SORTED_MAGIC:
+                raise ValueError(f"Not a sorted transaction index: {self.sorted_index_path}")
+            self._sorted_count = count
+
+    @staticmethod
+    def _map(path):
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return (len(self._data) - HEADER_SIZE) // RECORD_SIZE
+
+    def __getitem__(self, record_number):
+        if record_number < 0:
+            record_number += len(self)
+        if not 0 <= record_number < len(self):
+            raise IndexError("Record number out of range")
+        return _decode(RECORD.unpack_from(self._data, HEADER_SIZE + record_number * RECORD_SIZE))
+
+    # Record numbers of the customer hash: a binary search in the sorted index, then a scan of
+    # the index entries written after it.
+    def _record_numbers(self, key):
+        sorted_index, entry_size = self._sorted, INDEX_ENTRY.size
+        low, high = 0, self._sorted_count
+        while low < high:
+            middle = (low + high) // 2
+            if INDEX_KEY.unpack_from(sorted_index, SORTED_HEADER.size + middle * entry_size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        numbers = []
+        for position in range(low, self._sorted_count):
+            entry_key, record_number = INDEX_ENTRY.unpack_from(sorted_index, SORTED_HEADER.size + position * entry_size)
+            if entry_key != key:
+                break
+            numbers.append(record_number)
+
+        tail = self._sorted_count * entry_size
+        if tail < len(self._index):
+            numbers += sorted(
+                record_number
+                for entry_key, record_number in INDEX_ENTRY.iter_unpack(self._index[tail:])
+                if entry_key == key
+            )
+        return numbers
+
+    def by_customer(self, customer_id):
+        stored_id = _encode_customer_id(customer_id).decode("utf-8")
+        records = []
+        for record_number in self._record_numbers(customer_key(customer_id)):
+            record = self[record_number]
+            # Two customers can share a hash, the stored id settles it.
+            if record["customer_id"] == stored_id:
+                records.append(record)
+        return records
+
+    # Reads the log in chunks of records; slicing the mmap copies the chunk,
+    # so an unfinished scan does not keep the mapping from being closed.
+    def scan(self, chunk_records=65536):
+        end = HEADER_SIZE + len(self) * RECORD_SIZE
+        chunk_size = chunk_records * RECORD_SIZE
+        for start in range(HEADER_SIZE, end, chunk_size):
+            chunk = self._data[start:min(start + chunk_size, end)]
+            for fields in RECORD.iter_unpack(chunk):
+                yield _decode(fields)
+
+    def close(self):
+        for mapped in (self._data, self._index, self._sorted):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _decode(fields):
+    customer_id, amount, currency, status, timestamp = fields
+    return {
+        "customer_id": customer_id.rstrip(b"\0").decode("utf-8"),
+        "amount": amount,
+        "currency": currency.decode("ascii"),
+        "status": STATUSES[status],
+        "timestamp": timestamp,
+    }
+
+
+if __name__ == "__main__":
+    from f_dip import PaymentService
+    from b_srp import CustomerValidation, PaymentDataValidation
+    from c_ocp import CreditCardPaymentProcessor, EmailNotifier
+
+    with BinaryTransactionLogger() as logger:
+        payment_service = PaymentService(
+            customer_validator=CustomerValidation(),
+            payment_validator=PaymentDataValidation(),
+            logger=logger,
+            payment_processor=CreditCardPaymentProcessor(),
+            notifier=EmailNotifier(),
+        )
+
+        customer_data_with_email = {
+            "name": "John Doe",
+            "contact_info": {"email": "e@mail.com"},
+        }
+        payment_data = {"amount": 500, "source": "tok_mastercard", "cvv": 123}
+
+        payment_service.process_transaction(customer_data_with_email, payment_data)
+        # A name longer than the 32 bytes of the record is stored cut, the charge is still logged.
+        payment_service.process_transaction(
+            {"name": "Maria Jose Fernandez-Villanueva Garcia", "contact_info": {"email": "m@mail.com"}},
+            payment_data,
+        )
+
+    with TransactionLogReader() as reader:
+        print(len(reader), "records")
+        print(reader[-1])
+        print(reader.by_customer("John Doe"))
+        print(reader.by_customer("Maria Jose Fernandez-Villanueva Garcia"))
+        print(sum(record["amount"] for record in reader.scan()))
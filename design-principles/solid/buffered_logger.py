@@ -0,0 +1,161 @@
+### --- Buffered Transaction Logger --- ###
+
+# TransactionLogger in b_srp.py opens transactions.log, writes two lines and closes it
+# for every transaction. That is an open/close pair per charge.
+
+# BufferedTransactionLogger keeps the file open and collects the records in memory.
+# A background thread writes them in groups (group commit) when:
+# - the buffer reaches max_records, or
+# - flush_interval seconds have passed since the last write.
+# flush() forces the pending records to the file, and flush(fsync=True) also waits
+# until the operating system has them on disk (a durability barrier).
+
+# It is a subclass of TransactionLogger, so it can be passed as the logger of any
+# PaymentService (b_srp, c_ocp, f_dip) without changing the service. In b_srp and c_ocp
+# the logger is a class attribute, so it is replaced with: service.logger = BufferedTransactionLogger()
+# Call close() (or use it as a context manager) on shutdown so no record is lost.
+
+# log() only takes the buffer lock to append: the file is written under a separate I/O lock,
+# after the buffer has been swapped for an empty one, so callers never wait on the disk.
+# When a write fails (e.g. the disk is full), the records go back to the front of the buffer,
+# the error is reported as a log_write_failed event and the flusher tries again at the next
+# interval; until a write succeeds, log() and log_batch() raise that error, so the callers
+# know their records are not reaching the file.
+
+import os
+import threading
+from dataclasses import dataclass, field
+from b_srp import TransactionLogger
+from events import emit, ERROR
+
+
+@dataclass
+class BufferedTransactionLogger(TransactionLogger):
+    path: str = "transactions.log"
+    max_records: int = 1000
+    flush_interval: float = 1.0
+
+    _file: object = field(init=False, repr=False, default=None)
+    _buffer: list = field(init=False, repr=False, default_factory=list)
+    _lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+    _io_lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+    _error: Exception = field(init=False, repr=False, default=None)
+    _wake: threading.Event = field(init=False, repr=False, default_factory=threading.Event)
+    _closed: bool = field(init=False, repr=False, default=False)
+    _flusher: threading.Thread = field(init=False, repr=False, default=None)
+
+    def __post_init__(self):
+        self._file = open(self.path, "a")
+        self._flusher = threading.Thread(target=self._run_flusher, daemon=True)
+        self._flusher.start()
+
+    def log(self, customer_data, payment_data, charge):
+        record = (
+            f"{customer_data['name']} paid {charge['amount']} {charge['currency']}\n"
+            f"Payment status: {charge['status']}\n"
+        )
+        with self._lock:
+            if self._closed:
+                raise ValueError("Logger is closed")
+            if self._error is not None:
+                raise self._error
+            self._buffer.append(record)
+            full = len(self._buffer) >= self.max_records
+        if full:
+            self._wake.set()
+
+    def log_batch(self, entries):
+        records = [
+            f"{customer_data['name']} paid {charge['amount']} {charge['currency']}\n"
+            f"Payment status: {charge['status']}\n"
+            for customer_data, payment_data, charge in entries
+        ]
+        with self._lock:
+            if self._closed:
+                raise ValueError("Logger is closed")
+            if self._error is not None:
+                raise self._error
+            self._buffer.extend(records)
+            full = len(self._buffer) >= self.max_records
+        if full:
+            self._wake.set()
+
+    # Writes every pending record. With fsync=True the data is also on disk when it returns.
+    def flush(self, fsync=False):
+        with self._io_lock:
+            self._write_pending()
+            if fsync and not self._file.closed:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wake.set()
+        self._flusher.join()
+        with self._io_lock:
+            try:
+                self._write_pending()
+                os.fsync(self._file.fileno())
+            finally:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Must be called with the I/O lock held, so the swapped buffers are written in order.
+    def _write_pending(self):
+        with self._lock:
+            records, self._buffer = self._buffer, []
+        if not records:
+            return
+        try:
+            self._file.write("".join(records))
+            self._file.flush()
+        except Exception as e:
+            with self._lock:
+                self._buffer[:0] = records
+                self._error = e
+            raise
+        if self._error is not None:
+            with self._lock:
+                self._error = None
+
+    def _run_flusher(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            with self._io_lock:
+                try:
+                    self._write_pending()
+                except Exception as e:
+                    emit(ERROR, "log_write_failed", "Writing {path} failed: {error}", path=self.path, error=e)
+
+
+if __name__ == "__main__":
+    from f_dip import PaymentService
+    from b_srp import CustomerValidation, PaymentDataValidation
+    from c_ocp import CreditCardPaymentProcessor, EmailNotifier
+
+    with BufferedTransactionLogger(max_records=100) as logger:
+        payment_service = PaymentService(
+            customer_validator=CustomerValidation(),
+            payment_validator=PaymentDataValidation(),
+            logger=logger,
+            payment_processor=CreditCardPaymentProcessor(),
+            notifier=EmailNotifier(),
+        )
+
+        customer_data_with_email = {
+            "name": "John Doe",
+            "contact_info": {"email": "e@mail.com"},
+        }
+        payment_data = {"amount": 500, "source": "tok_mastercard", "cvv": 123}
+
+        payment_service.process_transaction(customer_data_with_email, payment_data)
+        payment_service.process_batch([(customer_data_with_email, payment_data)] * 3)
+        logger.flush(fsync=True)
@@ -25,6 +25,8 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from b_srp import CustomerValidation, PaymentDataValidation, TransactionLogger
+from charge import Charge, Currency
+from events import emit, INFO, ERROR
 
 
 class PaymentProcessor(ABC):
@@ -48,14 +50,16 @@ class EmailNotifier(Notifier):
 				msg["From"] = "no-reply@example.com"
 				msg["To"] = customer_data["contact_info"]["email"]
 
-				print("Email sent to", customer_data["contact_info"]["email"])
+				emit(INFO, "email_sent", "Email sent to {email}", email=customer_data["contact_info"]["email"])
                                 
 class SMSNotifier(Notifier):
 		def send_confirmation(self, customer_data):
 				phone_number = customer_data["contact_info"]["phone"]
 				sms_gateway = "the custom SMS Gateway"
-				print(
-						f"send the sms using {sms_gateway}: SMS sent to {phone_number}: Thank you for your payment."
+				emit(
+						INFO, "sms_sent",
+						"send the sms using {gateway}: SMS sent to {phone}: Thank you for your payment.",
+						gateway=sms_gateway, phone=phone_number,
 				)
                                 
                             
@@ -63,16 +67,15 @@ class SMSNotifier(Notifier):
 class CreditCardPaymentProcessor(PaymentProcessor):
     def process_transaction(self, customer_data, payment_data):
         try:
-            charge = {
-                "amount": payment_data["amount"],
-                "currency": "usd",
-                "source": payment_data["source"],
-                "description": customer_data["name"],
-                "status": "succeeded",
-            }
-            print("Payment successful")
+            charge = Charge(
+                amount=payment_data["amount"],
+                source=payment_data["source"],
+                description=customer_data["name"],
+                currency=payment_data.get("currency", Currency.USD),
+            )
+            emit(INFO, "payment_succeeded", "Payment successful")
         except Exception as e:
-            print("Payment failed:", e)
+            emit(ERROR, "payment_failed", "Payment failed: {error}", error=e)
             raise e
 
         return charge
@@ -0,0 +1,239 @@
+### --- Charge Records --- ###
+
+# The payment processors used to build a new five-key dict for every charge, and each dict
+# stored its own reference to the "usd" / "succeeded" strings. A dict costs a few hundred
+# bytes, which adds up when a whole settlement window of charges is kept in memory.
+
+# Charge is a dataclass with __slots__ (no per-instance __dict__). Status is an enum and
+# Currency an interned ISO 4217 code, so every charge shares the same few objects. Both
+# subclass str, so they still compare, format and encode like the old strings
+# ("usd" == Currency.USD).
+
+# Currency accepts any active ISO 4217 code (in any case, stored lowercase) listed in
+# MINOR_UNITS, with the number of digits of its minor unit; any other code is a ValueError.
+
+# Charge keeps dict-like access (charge["status"], charge.get("amount"), dict(charge)),
+# so the loggers and any code written against the old dicts keep working.
+
+# Every charge gets an id when it is created (charge.id, charge["id"]): a random prefix drawn
+# once per process and a counter, so ids are unique across processes and restarts and the
+# caller of process_transaction / process_batch has the id to refund the charge with.
+
+# ChargeBatch stores many charges by column: amounts, currencies and statuses live in
+# compact arrays, and only source/description are Python strings.
+
+import itertools
+import os
+from array import array
+from dataclasses import dataclass, fields
+from enum import Enum
+
+
+class _StrEnum(str, Enum):
+    def __str__(self):
+        return self.value
+
+    def __format__(self, format_spec):
+        return format(self.value, format_spec)
+
+
+# Active ISO 4217 currencies and the digits of their minor unit (cents: 2, yen: 0, fils: 3).
+MINOR_UNITS = dict.fromkeys((
+    "aed afn all amd ang aoa ars aud awg azn bam bbd bdt bgn bmd bnd bob bov brl bsd btn bwp"
+    " byn bzd cad cdf che chf chw cny cop cou crc cup cve czk dkk dop dzd egp ern etb eur fjd"
+    " fkp gbp gel ghs gip gmd gtq gyd hkd hnl htg huf idr ils inr irr jmd kes kgs khr kpw kyd"
+    " kzt lak lbp lkr lrd lsl mad mdl mga mkd mmk mnt mop mru mur mvr mwk mxn mxv myr mzn nad"
+    " ngn nio nok npr nzd pab pen pgk php pkr pln qar ron rsd rub sar sbd scr sdg sek sgd shp"
+    " sle sll sos srd ssp stn svc syp szl thb tjs tmt top try ttd twd tzs uah usd usn uyu uzs"
+    " ved ves wst xcd xcg yer zar zmw zwg zwl"
+).split(), 2)
+MINOR_UNITS.update(dict.fromkeys(
+    "bif clp djf gnf isk jpy kmf krw pyg rwf ugx uyi vnd vuv xaf xof xpf".split(), 0
+))
+MINOR_UNITS.update(dict.fromkeys("bhd iqd jod kwd lyd omr tnd".split(), 3))
+MINOR_UNITS.update(dict.fromkeys("clf uyw".split(), 4))
+
+
+class Currency(str):
+    __slots__ = ()
+    _interned = {}
+
+    # Currency("CHF") is Currency("chf"): one shared object per code.
+    def __new__(cls, code):
+        currency = cls._interned.get(code)
+        if currency is None:
+            normalized = code.lower() if isinstance(code, str) else code
+            if normalized not in MINOR_UNITS:
+                raise ValueError(f"{code!r} is not an ISO 4217 currency code")
+            currency = cls._interned.get(normalized)
+            if currency is None:
+                currency = cls._interned[normalized] = super().__new__(cls, normalized)
+            cls._interned[code] = currency
+        return currency
+
+    @property
+    def minor_units(self):
+        return MINOR_UNITS[self]
+
+    def __str__(self):
+        return str.__str__(self)
+
+    def __repr__(self):
+        return f"Currency({str.__repr__(self)})"
+
+
+for _code in ("usd", "eur", "gbp", "jpy", "cad", "mxn", "chf"):
+    setattr(Currency, _code.upper(), Currency(_code))
+
+
+class Status(_StrEnum):
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    PENDING = "pending"
+    REFUNDED = "refunded"
+
+
+_ID_PREFIX = os.urandom(6).hex()
+_ids = itertools.count()
+
+
+def new_charge_id():
+    return f"ch_{_ID_PREFIX}_{next(_ids)}"
+
+
+@dataclass(slots=True)
+class Charge:
+    amount: int
+    source: str
+    description: str
+    currency: Currency = Currency.USD
+    status: Status = Status.SUCCEEDED
+    id: str = None
+
+    def __post_init__(self):
+        self.currency = Currency(self.currency)
+        self.status = Status(self.status)
+        if self.id is None:
+            self.id = new_charge_id()
+
+    # --- dict-like access, for the code written against the old charge dicts --- #
+    def __getitem__(self, key):
+        if key not in _KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    # Like __post_init__, a currency or status set by key is converted (and validated).
+    def __setitem__(self, key, value):
+        if key not in _KEYS:
+            raise KeyError(key)
+        if key == "currency":
+            value = Currency(value)
+        elif key == "status":
+            value = Status(value)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in _KEYS
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in _KEYS else default
+
+    def keys(self):
+        return _KEYS
+
+    def values(self):
+        return [getattr(self, key) for key in _KEYS]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in _KEYS]
+
+    def to_dict(self):
+        charge = {key: getattr(self, key) for key in _KEYS}
+        charge["currency"] = str(self.currency)
+        charge["status"] = str(self.status)
+        return charge
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        if isinstance(other, Charge):
+            return self.items() == other.items()
+        return NotImplemented
+
+
+_KEYS = ("id", "amount", "currency", "source", "description", "status")
+assert set(_KEYS) == {f.name for f in fields(Charge)}
+
+_CURRENCIES = tuple(map(Currency, MINOR_UNITS))
+_CURRENCY_CODES = {currency: code for code, currency in enumerate(_CURRENCIES)}
+_STATUSES = tuple(Status)
+_STATUS_CODES = {status: code for code, status in enumerate(_STATUSES)}
+
+
+class ChargeBatch:
+    __slots__ = ("ids", "amounts", "currencies", "statuses", "sources", "descriptions")
+
+    def __init__(self, charges=()):
+        self.ids = []
+        self.amounts = array("q")
+        self.currencies = array("B")
+        self.statuses = array("B")
+        self.sources = []
+        self.descriptions = []
+        self.extend(charges)
+
+    def append(self, charge):
+        self.ids.append(charge.get("id") or new_charge_id())
+        self.amounts.append(charge["amount"])
+        self.currencies.append(_CURRENCY_CODES[Currency(charge["currency"])])
+        self.statuses.append(_STATUS_CODES[Status(charge["status"])])
+        self.sources.append(charge["source"])
+        self.descriptions.append(charge["description"])
+
+    def extend(self, charges):
+        for charge in charges:
+            self.append(charge)
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def __getitem__(self, index):
+        return Charge(
+            amount=self.amounts[index],
+            source=self.sources[index],
+            description=self.descriptions[index],
+            currency=_CURRENCIES[self.currencies[index]],
+            status=_STATUSES[self.statuses[index]],
+            id=self.ids[index],
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def total(self, status=Status.SUCCEEDED):
+        code = _STATUS_CODES[Status(status)]
+        return sum(
+            amount for amount, status_code in zip(self.amounts, self.statuses) if status_code == code
+        )
+
+
+if __name__ == "__main__":
+    import sys
+
+    charge = Charge(amount=500, source="tok_mastercard", description="John Doe")
+    print(charge["status"], charge == {
+        "id": charge.id,
+        "amount": 500,
+        "currency": "usd",
+        "source": "tok_mastercard",
+        "description": "John Doe",
+        "status": "succeeded",
+    })
+    print("Charge:", sys.getsizeof(charge), "bytes, dict:", sys.getsizeof(charge.to_dict()), "bytes")
+
+    batch = ChargeBatch([charge] * 3)
+    print(len(batch), "charges, total", batch.total())
+
+    charge["status"] = "refunded"
+    print(charge.to_dict()["status"], charge == Charge(500, "tok_mastercard", "John Doe", status=Status.REFUNDED, id=charge.id))
@@ -0,0 +1,230 @@
+### --- Coalescing Notifier --- ###
+
+# EmailNotifier and SMSNotifier send one message per transaction. A customer who pays many
+# times in a few minutes gets one message per payment, and the SMS gateway throttles us.
+
+# CoalescingNotifier groups the confirmations per customer (per email address / phone number):
+# - the first confirmation of a customer is sent at once
+# - the confirmations that arrive in the next `window` seconds are counted, and sent as one
+#   digest when the window ends; the digest opens a new window, and a window without new
+#   confirmations ends the group
+# A digest is a single send_confirmation call on the wrapped notifier, with the number of
+# grouped payments in customer_data["confirmations"]. The default notifiers,
+# DigestEmailNotifier and DigestSMSNotifier, word it as a summary ("Thank you for your 12
+# payments."); EmailNotifier / SMSNotifier of c_ocp.py would send their usual single-payment
+# text. A customer paying every few seconds gets one message per window instead of one per
+# payment.
+
+# Sending is done by one background thread per channel (email, phone), each through its own
+# token bucket: at most `rate` messages per second, with bursts of up to `burst` messages. An
+# exhausted SMS bucket only holds up SMS, never email. send_confirmation never waits for the
+# gateway or the rate limit.
+
+# close() sends every pending digest (still within the rate limits) and stops the thread.
+
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from c_ocp import Notifier
+from events import emit, ERROR, INFO
+
+
+def confirmation_text(customer_data):
+    count = customer_data.get("confirmations", 1)
+    if count == 1:
+        return "Thank you for your payment."
+    return f"Thank you for your {count} payments. This message confirms all of them."
+
+
+# The c_ocp notifiers, with the text of a digest when customer_data["confirmations"] is set.
+class DigestEmailNotifier(Notifier):
+    def send_confirmation(self, customer_data):
+        count = customer_data.get("confirmations", 1)
+        msg = {}
+        msg["Subject"] = "Payment Confirmation" if count == 1 else f"{count} Payment Confirmations"
+        msg["From"] = "no-reply@example.com"
+        msg["To"] = customer_data["contact_info"]["email"]
+        msg["Body"] = confirmation_text(customer_data)
+
+        emit(INFO, "email_sent", "Email sent to {email}: {subject}", email=msg["To"], subject=msg["Subject"])
+
+
+class DigestSMSNotifier(Notifier):
+    def send_confirmation(self, customer_data):
+        emit(
+            INFO, "sms_sent",
+            "send the sms using {gateway}: SMS sent to {phone}: {text}",
+            gateway="the custom SMS Gateway",
+            phone=customer_data["contact_info"]["phone"],
+            text=confirmation_text(customer_data),
+        )
+
+
+@dataclass
+class TokenBucket:
+    rate: float
+    burst: float = 1.0
+
+    _tokens: float = field(init=False, repr=False, default=None)
+    _updated: float = field(init=False, repr=False, default=None)
+    _lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+
+    def __post_init__(self):
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    # Waits until a token is available and takes it.
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+@dataclass
+class _Group:
+    customer_data: dict
+    count: int
+    due: float
+
+
+@dataclass
+class CoalescingNotifier(Notifier):
+    email: Notifier = field(default_factory=DigestEmailNotifier)
+    sms: Notifier = field(default_factory=DigestSMSNotifier)
+    window: float = 60.0
+    email_rate: float = 50.0
+    email_burst: float = 100.0
+    sms_rate: float = 5.0
+    sms_burst: float = 10.0
+
+    received: int = field(init=False, default=0)
+    sent: int = field(init=False, default=0)
+    _groups: dict = field(init=False, repr=False, default_factory=dict)
+    _due: dict = field(init=False, repr=False, default_factory=dict)
+    _order: object = field(init=False, repr=False, default_factory=itertools.count)
+    _buckets: dict = field(init=False, repr=False, default_factory=dict)
+    _lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+    _wakes: dict = field(init=False, repr=False, default_factory=dict)
+    _closed: bool = field(init=False, repr=False, default=False)
+    _senders: list = field(init=False, repr=False, default_factory=list)
+
+    def __post_init__(self):
+        self._buckets = {
+            "email": TokenBucket(self.email_rate, self.email_burst),
+            "phone": TokenBucket(self.sms_rate, self.sms_burst),
+        }
+        for channel in self._buckets:
+            self._due[channel] = []
+            self._wakes[channel] = threading.Event()
+            sender = threading.Thread(target=self._run_sender, args=(channel,), daemon=True)
+            sender.start()
+            self._senders.append(sender)
+
+    def send_confirmation(self, customer_data):
+        contact_info = customer_data.get("contact_info") or {}
+        if "email" in contact_info:
+            channel = "email"
+        elif "phone" in contact_info:
+            channel = "phone"
+        else:
+            raise ValueError("Invalid customer data: missing contact info")
+        key = (channel, contact_info[channel])
+
+        with self._lock:
+            if self._closed:
+                raise ValueError("Notifier is closed")
+            self.received += 1
+            group = self._groups.get(key)
+            if group is not None:
+                group.customer_data = customer_data
+                group.count += 1
+                return
+            now = time.monotonic()
+            self._groups[key] = _Group(customer_data, 1, now)
+            heapq.heappush(self._due[channel], (now, next(self._order), key))
+        self._wakes[channel].set()
+
+    # Sends every pending confirmation and digest, then stops the sender threads.
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for wake in self._wakes.values():
+            wake.set()
+        for sender in self._senders:
+            sender.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _take_due(self, channel, now):
+        due = self._due[channel]
+        ready = []
+        with self._lock:
+            while due and (due[0][0] <= now or self._closed):
+                _, _, key = heapq.heappop(due)
+                group = self._groups[key]
+                if group.count == 0:
+                    del self._groups[key]
+                    continue
+                ready.append((group.customer_data, group.count))
+                group.count = 0
+                group.due = now + self.window
+                heapq.heappush(due, (group.due, next(self._order), key))
+            next_due = due[0][0] if due else None
+        return ready, next_due
+
+    def _send(self, channel, notifier, customer_data, count):
+        self._buckets[channel].acquire()
+        if count > 1:
+            customer_data = {**customer_data, "confirmations": count}
+        try:
+            notifier.send_confirmation(customer_data)
+            with self._lock:
+                self.sent += 1
+        except Exception as e:
+            emit(ERROR, "notification_failed", "Notification failed: {error}", error=e)
+
+    def _run_sender(self, channel):
+        notifier = self.email if channel == "email" else self.sms
+        wake = self._wakes[channel]
+        while True:
+            closed = self._closed
+            ready, next_due = self._take_due(channel, time.monotonic())
+            for customer_data, count in ready:
+                self._send(channel, notifier, customer_data, count)
+            if closed and not ready:
+                return
+            if not ready:
+                timeout = None if next_due is None else max(0, next_due - time.monotonic())
+                wake.wait(timeout)
+                wake.clear()
+
+
+if __name__ == "__main__":
+    customers = [
+        {"name": f"Customer {number}", "contact_info": {"email": f"customer{number}@mail.com"}}
+        for number in range(3)
+    ]
+    customers.append({"name": "Python SPR", "contact_info": {"phone": "1234567890"}})
+
+    with CoalescingNotifier(window=0.2) as notifier:
+        for _ in range(50):
+            for customer_data in customers:
+                notifier.send_confirmation(customer_data)
+            time.sleep(0.01)
+
+    print(f"{notifier.received} confirmations, {notifier.sent} messages sent")
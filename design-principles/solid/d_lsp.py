@@ -18,6 +18,7 @@
 # - Reduces errors in executing time.
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
+from events import emit, INFO
 
 class Notifier(ABC):
 		@abstractmethod
@@ -28,15 +29,21 @@ class SMSNotifier(Notifier):
 		def send_confirmation(self, customer_data):
 				phone_number = customer_data["contact_info"]["phone"]
 				sms_gateway = "the custom SMS Gateway"
-				print(
-						f"send the sms using {sms_gateway}: SMS sent to {phone_number}: Thank you for your payment."
+				emit(
+						INFO, "sms_sent",
+						"send the sms using {gateway}: SMS sent to {phone}: Thank you for your payment.",
+						gateway=sms_gateway, phone=phone_number,
 				)
 
 class EmailNotifier(Notifier):
 		# The method send_confirmation is violating the Liskov Substitution Principle because it is not respecting the contract of the base class,
 		#then will be errors if any substitution is made.
 		def send_confirmation(self, customer_data, sms_gateway):
-				print(f"send the sms using {sms_gateway}: SMS sent to {customer_data['contact_info']['phone']}: Thank you for your payment.")
+				emit(
+						INFO, "sms_sent",
+						"send the sms using {gateway}: SMS sent to {phone}: Thank you for your payment.",
+						gateway=sms_gateway, phone=customer_data["contact_info"]["phone"],
+				)
 
 ### --- Correct EmailNotifier --- ###
 @dataclass
@@ -45,4 +52,8 @@ class EmailNotifier(Notifier):
 
 		#this way the method respects the contract of the base class and the Liskov Substitution Principle.
 		def send_confirmation(self, customer_data):
-				print(f"send the sms using {self.sms_gateway}: SMS sent to {customer_data['contact_info']['phone']}: Thank you for your payment.")
\ No newline at end of file
+				emit(
+						INFO, "sms_sent",
+						"send the sms using {gateway}: SMS sent to {phone}: Thank you for your payment.",
+						gateway=self.sms_gateway, phone=customer_data["contact_info"]["phone"],
+				)
\ No newline at end of file
@@ -16,6 +16,8 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from b_srp import CustomerValidation, PaymentDataValidation, TransactionLogger
+from charge import Charge, Currency
+from events import emit, INFO, ERROR
 
 # A new method is added to the PaymentProcessor class
 # if a class that implements the PaymentProcessor interface does not need to implement the new method, 
@@ -38,45 +40,44 @@ class PaymentProcessor(ABC):
                 ...
 
 class RefundProcessor(ABC):
+        # amount None means a full refund of the charge.
         @abstractmethod
-        def refund_transaction(self):
+        def refund_transaction(self, charge_id, amount=None):
                 ...
 
 @dataclass
 class CreditCardPaymentProcessor(PaymentProcessor, RefundProcessor):
     def process_transaction(self, customer_data, payment_data):
         try:
-            charge = {
-                "amount": payment_data["amount"],
-                "currency": "usd",
-                "source": payment_data["source"],
-                "description": customer_data["name"],
-                "status": "succeeded",
-            }
-            print("Payment successful")
+            charge = Charge(
+                amount=payment_data["amount"],
+                source=payment_data["source"],
+                description=customer_data["name"],
+                currency=payment_data.get("currency", Currency.USD),
+            )
+            emit(INFO, "payment_succeeded", "Payment successful")
         except Exception as e:
-            print("Payment failed:", e)
+            emit(ERROR, "payment_failed", "Payment failed: {error}", error=e)
             raise e
 
         return charge
     
-    def refund_transaction(self):
-           print("Refund processed")
+    def refund_transaction(self, charge_id, amount=None):
+           emit(INFO, "refund_processed", "Refund processed")
 
 @dataclass
 class TransferTransactionProcessor(PaymentProcessor):
         def process_transaction(self, customer_data, payment_data):
                 try:
-                    charge = {
-                        "amount": payment_data["amount"],
-                        "currency": "usd",
-                        "source": payment_data["source"],
-                        "description": customer_data["name"],
-                        "status": "succeeded",
-                    }
-                    print("Payment successful")
+                    charge = Charge(
+                        amount=payment_data["amount"],
+                        source=payment_data["source"],
+                        description=customer_data["name"],
+                        currency=payment_data.get("currency", Currency.USD),
+                    )
+                    emit(INFO, "payment_succeeded", "Payment successful")
                 except Exception as e:
-                    print("Payment failed:", e)
+                    emit(ERROR, "payment_failed", "Payment failed: {error}", error=e)
                     raise e
 
                 return charge
@@ -10,12 +10,29 @@
 # - Flexibility to change the implementation details without affecting the high-level modules.
 from b_srp import CustomerValidation, PaymentDataValidation, TransactionLogger
 from c_ocp import PaymentProcessor, Notifier, CreditCardPaymentProcessor, EmailNotifier
+from instrumentation import Instrumentation
 from dataclasses import dataclass
+from typing import Optional
+import time
 
 # See b_srp and c_ocp to understand the problem with the code.
 # In those modules, PaymentService, though it follows most of the DIP rules, 
 # is still instantiating the concrete classes of its dependencies.
 
+
+# Result of one item of PaymentService.process_batch, either a charge or the error that stopped it.
+# log_error is set when the charge went through but could not be written to the transaction log:
+# the item is still ok (the customer was charged and must not be charged again).
+@dataclass
+class TransactionResult:
+        charge: Optional[dict] = None
+        error: Optional[Exception] = None
+        log_error: Optional[Exception] = None
+
+        @property
+        def ok(self):
+                return self.error is None
+
 @dataclass
 class PaymentService:
         customer_validator: CustomerValidation
@@ -23,27 +40,110 @@ class PaymentService:
         logger: TransactionLogger
         payment_processor: PaymentProcessor
         notifier: Notifier
+        # Optional per-stage timers and counters, see instrumentation.py.
+        instrumentation: Optional[Instrumentation] = None
         
+        # With instrumentation, a probe (see instrumentation.py) marks the end of every stage.
         def process_transaction(self, customer_data, payment_data):
+                probe = None if self.instrumentation is None else self.instrumentation.probe()
                 try:
-                    self.customer_validator.validate(customer_data)
-                except ValueError as e:
-                     raise e
+                    try:
+                        self.customer_validator.validate(customer_data)
+                    except ValueError as e:
+                         raise e
+                    if probe is not None:
+                        probe.mark()
 
-                try:
-                    self.payment_validator.validate(payment_data)
-                except ValueError as e:
-                    raise e
+                    try:
+                        self.payment_validator.validate(payment_data)
+                    except ValueError as e:
+                        raise e
+                    if probe is not None:
+                        probe.mark()
 
-                try:
-                    charge = self.payment_processor.process_transaction(
-                        customer_data, payment_data
-                    )
-                    self.notifier.send_confirmation(customer_data)
-                    self.logger.log(customer_data, payment_data, charge)
-                    return charge
-                except ValueError as e:
-                     raise e
+                    try:
+                        charge = self.payment_processor.process_transaction(
+                            customer_data, payment_data
+                        )
+                        if probe is not None:
+                            probe.mark()
+                        self.notifier.send_confirmation(customer_data)
+                        if probe is not None:
+                            probe.mark()
+                        self.logger.log(customer_data, payment_data, charge)
+                        if probe is not None:
+                            probe.mark()
+                            probe.done()
+                        return charge
+                    except ValueError as e:
+                         raise e
+                except Exception as e:
+                    if probe is not None:
+                        probe.fail(e)
+                    raise
+
+        # Batch entry point: validates, charges and notifies every pair in one pass
+        # and writes all the successful charges to the log with a single file open.
+        # A failing item is reported in its own result instead of failing the batch, and
+        # a failing log write is reported in the results of the charges it did not record.
+        # With instrumentation, every item has its probe; the single log write is timed once
+        # and its duration is shared evenly between the charges it wrote.
+        def process_batch(self, pairs):
+                instrumentation = self.instrumentation
+                validate_customer = self.customer_validator.validate
+                validate_payment = self.payment_validator.validate
+                process = self.payment_processor.process_transaction
+                send_confirmation = self.notifier.send_confirmation
+
+                results = []
+                logged = []
+                probes = []
+                to_log = []
+                for customer_data, payment_data in pairs:
+                    probe = None if instrumentation is None else instrumentation.probe()
+                    try:
+                        validate_customer(customer_data)
+                        if probe is not None:
+                            probe.mark()
+                        validate_payment(payment_data)
+                        if probe is not None:
+                            probe.mark()
+                        charge = process(customer_data, payment_data)
+                        if probe is not None:
+                            probe.mark()
+                        send_confirmation(customer_data)
+                        if probe is not None:
+                            probe.mark()
+                    except Exception as e:
+                        if probe is not None:
+                            probe.fail(e)
+                        results.append(TransactionResult(error=e))
+                        continue
+
+                    result = TransactionResult(charge=charge)
+                    results.append(result)
+                    logged.append(result)
+                    probes.append(probe)
+                    to_log.append((customer_data, payment_data, charge))
+
+                if to_log:
+                    started = None if instrumentation is None else time.perf_counter_ns()
+                    error = None
+                    try:
+                        self.logger.log_batch(to_log)
+                    except Exception as e:
+                        error = e
+                        for result in logged:
+                            result.log_error = e
+                    if started is not None:
+                        share = (time.perf_counter_ns() - started) // len(to_log)
+                        for probe in probes:
+                            if error is None:
+                                probe.mark(share)
+                                probe.done()
+                            else:
+                                probe.fail(error, share)
+                return results
 							
 if __name__ == "__main__":
     customer_validator = CustomerValidation()
@@ -67,4 +167,20 @@ if __name__ == "__main__":
     payment_data = {"amount": 500, "source": "tok_mastercard", "cvv": 123}
 
     payment_processor_with_email.process_transaction(customer_data_with_email, payment_data)
+
+    results = payment_processor_with_email.process_batch([
+        (customer_data_with_email, payment_data),
+        ({"name": "", "contact_info": {}}, payment_data),
+    ])
+    for result in results:
+        print(result.charge if result.ok else f"Transaction failed: {result.error}")
+
+    # The log cannot be written: the charges are still returned, with the log error.
+    class FailingLogger(TransactionLogger):
+        def log_batch(self, entries):
+            raise OSError("transactions.log: No space left on device")
+
+    payment_processor_with_email.logger = FailingLogger()
+    for result in payment_processor_with_email.process_batch([(customer_data_with_email, payment_data)]):
+        print(result.charge, f"not logged: {result.log_error}")
     
\ No newline at end of file
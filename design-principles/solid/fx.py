@@ -0,0 +1,166 @@
+### --- Currency Conversion --- ###
+
+# The processors take the currency of the payment from payment_data["currency"] (usd when it
+# is missing), and the charge is recorded in that currency. Settlement is in one currency, so
+# the charges used to be converted and written again in a second pass over the settlement file.
+
+# SettlingPaymentProcessor converts each charge to the settlement currency as part of the
+# charge path, and FXConverter.convert_batch converts a whole ChargeBatch at once.
+
+# Amounts are integers in minor units (cents for usd, yen for jpy: see charge.MINOR_UNITS).
+# - RateTable holds the rates as Decimal, loaded from JSON ({"base": "usd", "rates": {"eur": "0.92"}})
+#   and never modified. The rate of a pair (including the minor units of both currencies) is
+#   computed as an exact integer fraction numerator / denominator (no division is rounded)
+#   the first time the pair is used, and cached in the table.
+# - A conversion is then integer arithmetic: amount * numerator / denominator, rounded half to
+#   even. No float is involved, and a single charge and a batch give the same result.
+# - FXConverter.refresh() installs a new table with one assignment. A conversion reads the table
+#   once, so a batch is always converted with a single table, even during a refresh.
+
+import json
+import time
+from array import array
+from dataclasses import dataclass, field
+from decimal import Decimal
+from math import gcd
+from c_ocp import PaymentProcessor
+from charge import ChargeBatch, Currency, MINOR_UNITS, _CURRENCIES, _CURRENCY_CODES
+
+
+def _round_half_even(numerator, denominator):
+    quotient, remainder = divmod(numerator, denominator)
+    if remainder * 2 > denominator or (remainder * 2 == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+@dataclass(frozen=True)
+class RateTable:
+    base: Currency
+    rates: dict  # Currency -> Decimal, units of the currency for one unit of base
+    loaded_at: float = field(default_factory=time.time)
+
+    _factors: dict = field(init=False, repr=False, compare=False, default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data):
+        base = Currency(data["base"])
+        rates = {Currency(code): Decimal(str(rate)) for code, rate in data["rates"].items()}
+        rates[base] = Decimal(1)
+        return cls(base=base, rates=rates)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            return cls.from_dict(json.load(file))
+
+    # (numerator, denominator) that converts minor units of `source` to minor units of `target`.
+    def factor(self, source, target):
+        pair = (source, target)
+        factor = self._factors.get(pair)
+        if factor is None:
+            source, target = Currency(source), Currency(target)
+            if source not in self.rates or target not in self.rates:
+                raise ValueError(f"No exchange rate from {source} to {target}")
+            target_numerator, target_denominator = self.rates[target].as_integer_ratio()
+            source_numerator, source_denominator = self.rates[source].as_integer_ratio()
+            numerator = target_numerator * source_denominator
+            denominator = target_denominator * source_numerator
+            digits = MINOR_UNITS[target] - MINOR_UNITS[source]
+            if digits > 0:
+                numerator *= 10 ** digits
+            else:
+                denominator *= 10 ** -digits
+            common = gcd(numerator, denominator)
+            factor = (numerator // common, denominator // common)
+            self._factors[pair] = factor
+        return factor
+
+    def convert(self, amount, source, target):
+        if source == target:
+            return amount
+        numerator, denominator = self.factor(source, target)
+        return _round_half_even(amount * numerator, denominator)
+
+
+@dataclass
+class FXConverter:
+    table: RateTable
+    path: str = None
+
+    @classmethod
+    def load(cls, path):
+        return cls(table=RateTable.load(path), path=path)
+
+    # Installs a new table; conversions already running keep the table they started with.
+    def refresh(self, table=None):
+        self.table = table if table is not None else RateTable.load(self.path)
+
+    def convert(self, amount, source, target):
+        return self.table.convert(amount, source, target)
+
+    # Converts every charge of the batch to `target`, one pass over the columns.
+    def convert_batch(self, batch, target):
+        table = self.table
+        target = Currency(target)
+        factors = {
+            _CURRENCY_CODES[currency]: table.factor(currency, target)
+            for currency in _CURRENCIES
+            if currency in table.rates
+        }
+
+        converted = ChargeBatch()
+        if set(batch.currencies) <= {_CURRENCY_CODES[target]}:
+            converted.amounts = array("q", batch.amounts)
+        else:
+            converted.amounts = array("q", [
+                _round_half_even(amount * factors[code][0], factors[code][1])
+                for amount, code in zip(batch.amounts, batch.currencies)
+            ])
+        converted.currencies = array("B", [_CURRENCY_CODES[target]]) * len(batch)
+        converted.statuses = array("B", batch.statuses)
+        converted.sources = list(batch.sources)
+        converted.descriptions = list(batch.descriptions)
+        return converted
+
+
+# Wraps a PaymentProcessor: the charge is converted to the settlement currency before it is returned.
+@dataclass
+class SettlingPaymentProcessor(PaymentProcessor):
+    processor: PaymentProcessor
+    converter: FXConverter
+    settlement_currency: Currency = Currency.USD
+
+    def process_transaction(self, customer_data, payment_data):
+        charge = self.processor.process_transaction(customer_data, payment_data)
+        if charge["currency"] != self.settlement_currency:
+            charge["amount"] = self.converter.convert(charge["amount"], charge["currency"], self.settlement_currency)
+            charge["currency"] = self.settlement_currency
+        return charge
+
+
+if __name__ == "__main__":
+    from c_ocp import CreditCardPaymentProcessor
+    from charge import Charge
+
+    converter = FXConverter(RateTable.from_dict({
+        "base": "usd",
+        "rates": {"eur": "0.9215", "gbp": "0.7893", "jpy": "149.62", "cad": "1.3688", "mxn": "17.254", "chf": "0.8812"},
+    }))
+    processor = SettlingPaymentProcessor(CreditCardPaymentProcessor(), converter, Currency.USD)
+
+    customer_data = {"name": "John Doe", "contact_info": {"email": "e@mail.com"}}
+    for amount, currency in ((500, "usd"), (500, "eur"), (50000, "jpy"), (500, "CHF")):
+        charge = processor.process_transaction(customer_data, {"amount": amount, "source": "tok_visa", "currency": currency})
+        print(amount, currency, "->", charge["amount"], charge["currency"])
+
+    batch = ChargeBatch(
+        Charge(amount=100 * number, source="tok_visa", description="Customer", currency=currency)
+        for number, currency in enumerate(("eur", "gbp", "jpy", "cad", "mxn", "usd") * 2)
+    )
+    settled = converter.convert_batch(batch, "usd")
+    print(list(settled.amounts), settled.total())
+    print(all(
+        settled.amounts[index] == converter.convert(charge["amount"], charge["currency"], "usd")
+        for index, charge in enumerate(batch)
+    ))
@@ -0,0 +1,189 @@
+### --- Idempotency Keys --- ###
+
+# Clients retry process_transaction when a call times out. Without protection every retry
+# runs validation, the processor, the notifier and the logger again, and can charge twice.
+
+# IdempotentPaymentService wraps any PaymentService (Decorator/Proxy). A transaction with an
+# idempotency key (the idempotency_key argument, or payment_data["idempotency_key"]):
+# - returns the stored charge when the same key succeeded before (cache hit, no work done)
+# - waits for the first call when the same key is already being processed, and then
+#   returns its charge (or raises its error); the work runs only once
+# - is processed normally otherwise, and the charge is stored under the key
+# Transactions without a key are passed straight to the wrapped service.
+# A key is stored with the fingerprint of its request (customer, amount, currency, source): a
+# key reused for a different request raises IdempotencyKeyReusedError instead of returning
+# the charge of the first one.
+
+# The cache keeps at most max_entries keys (least recently used are evicted first), and a
+# key expires ttl seconds after it was stored. Failed calls are not cached, so a retry
+# after an error is processed again.
+# With spill_path, evicted keys are moved to an on-disk shelve instead of being forgotten.
+# The keys in the shelve are also kept in an in-memory set, so a new key (the common miss)
+# never reads the disk, only a key that was spilled does.
+
+import shelve
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+
+class IdempotencyKeyReusedError(ValueError):
+    pass
+
+
+def fingerprint(customer_data, payment_data):
+    return (
+        customer_data.get("id", customer_data.get("name")),
+        payment_data.get("amount"),
+        str(payment_data.get("currency", "usd")).lower(),
+        payment_data.get("source"),
+    )
+
+
+@dataclass
+class _InFlight:
+    fingerprint: tuple
+    done: threading.Event = field(default_factory=threading.Event)
+    charge: object = None
+    error: Exception = None
+
+
+@dataclass
+class IdempotentPaymentService:
+    service: object
+    max_entries: int = 100_000
+    ttl: float = 24 * 60 * 60
+    spill_path: str = None
+
+    _cache: OrderedDict = field(init=False, repr=False, default_factory=OrderedDict)
+    _in_flight: dict = field(init=False, repr=False, default_factory=dict)
+    _lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+    _spill: object = field(init=False, repr=False, default=None)
+    _spilled: set = field(init=False, repr=False, default_factory=set)
+    hits: int = field(init=False, default=0)
+    misses: int = field(init=False, default=0)
+
+    def __post_init__(self):
+        if self.spill_path is not None:
+            self._spill = shelve.open(self.spill_path)
+            self._spilled = set(self._spill.keys())
+
+    def process_transaction(self, customer_data, payment_data, idempotency_key=None):
+        key = idempotency_key or payment_data.get("idempotency_key")
+        if key is None:
+            return self.service.process_transaction(customer_data, payment_data)
+
+        request = fingerprint(customer_data, payment_data)
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                charge, stored = entry
+                _check(key, stored, request)
+                self.hits += 1
+                return charge
+
+            in_flight = self._in_flight.get(key)
+            first = in_flight is None
+            if first:
+                in_flight = self._in_flight[key] = _InFlight(request)
+                self.misses += 1
+            else:
+                _check(key, in_flight.fingerprint, request)
+                self.hits += 1
+
+        if not first:
+            in_flight.done.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return in_flight.charge
+
+        try:
+            in_flight.charge = self.service.process_transaction(customer_data, payment_data)
+        except Exception as e:
+            in_flight.error = e
+            raise
+        else:
+            with self._lock:
+                self._store(key, in_flight.charge, request)
+            return in_flight.charge
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            in_flight.done.set()
+
+    # Returns (charge, fingerprint) of a stored key. Must be called with the lock held.
+    def _lookup(self, key):
+        now = time.monotonic()
+        entry = self._cache.get(key)
+        if entry is not None:
+            charge, stored, expires_at = entry
+            if expires_at > now:
+                self._cache.move_to_end(key)
+                return charge, stored
+            del self._cache[key]
+            return None
+
+        if key in self._spilled:
+            self._spilled.discard(key)
+            charge, stored, expires_at = self._spill.pop(key)
+            # time.monotonic() is not valid across processes, the spill stores wall time.
+            if expires_at > time.time():
+                self._store(key, charge, stored, expires_at - time.time())
+                return charge, stored
+        return None
+
+    # Must be called with the lock held.
+    def _store(self, key, charge, stored, ttl=None):
+        self._cache[key] = (charge, stored, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            old_key, (old_charge, old_stored, expires_at) = self._cache.popitem(last=False)
+            remaining = expires_at - time.monotonic()
+            if self._spill is not None and remaining > 0:
+                self._spill[old_key] = (old_charge, old_stored, time.time() + remaining)
+                self._spilled.add(old_key)
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _check(key, stored, request):
+    if stored != request:
+        raise IdempotencyKeyReusedError(f"Idempotency key {key} was already used for a different request")
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+    from sharded_executor import default_service_factory
+
+    payment_service = IdempotentPaymentService(default_service_factory(), max_entries=1000)
+
+    customer_data_with_email = {
+        "name": "John Doe",
+        "contact_info": {"email": "e@mail.com"},
+    }
+    payment_data = {"amount": 500, "source": "tok_mastercard", "idempotency_key": "order-1"}
+
+    # Five concurrent retries of the same request: the payment is processed once.
+    with ThreadPoolExecutor(5) as pool:
+        charges = list(pool.map(
+            lambda _: payment_service.process_transaction(customer_data_with_email, payment_data),
+            range(5),
+        ))
+
+    print(all(charge is charges[0] for charge in charges))
+    print(payment_service.hits, "hits,", payment_service.misses, "miss")
+
+    # The same key with another amount is a client bug, not a retry.
+    try:
+        payment_service.process_transaction(customer_data_with_email, {**payment_data, "amount": 900})
+    except IdempotencyKeyReusedError as e:
+        print(e)
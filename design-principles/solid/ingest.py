@@ -0,0 +1,258 @@
+### --- Streaming Ingestion CLI --- ###
+
+# Runs customer/payment records from a JSONL or CSV file through PaymentService without
+# loading the file in memory. It is a pipeline of generators:
+#   read_records (one record at a time) -> chunked (chunk_size records) -> process_batch
+# A chunk is only read when the previous one has been processed (pull-based backpressure),
+# so at most one chunk is in memory, whatever the size of the input.
+
+# Record formats (one transaction per line / row):
+# - JSONL: {"customer": {"name": ..., "contact_info": {...}}, "payment": {"amount": ..., "source": ...}}
+#   or the flat form of the CSV columns below.
+# - CSV with a header: name, email, phone, amount, source (and optionally id). Each row must
+#   fit on one line (no quoted newlines), because rows are read line by line to know their offset.
+# Amounts are whole numbers of minor units (500 is 5.00 usd), like everywhere else in the
+# package: a record with a decimal amount such as 1.5 is rejected, not charged.
+
+# A charge that went through but could not be written to the transaction log is not counted
+# as succeeded: it is counted as unlogged and written to --errors with "charged": true, so it
+# can be logged by hand (it must not be charged again).
+
+# Checkpoints: after every chunk the byte offset of the next unread record, and the number of
+# the last line read, are written to the checkpoint file. With --resume the run starts from
+# that offset, so a stopped run does not charge the records of the finished chunks again, and
+# the line numbers of the error report go on from where they were.
+
+# Usage:
+#   python ingest.py settlement.jsonl --chunk-size 5000 --checkpoint settlement.ckpt --resume
+#   python ingest.py settlement.csv --errors rejected.jsonl --workers 4
+
+import argparse
+import csv
+import json
+import os
+import sys
+from dataclasses import dataclass, field
+from b_srp import CustomerValidation, PaymentDataValidation, TransactionLogger
+from c_ocp import CreditCardPaymentProcessor, EmailNotifier, Notifier, SMSNotifier
+from f_dip import PaymentService
+
+
+# Sends the confirmation through the channel the customer has (email first, then SMS).
+@dataclass
+class ContactInfoNotifier(Notifier):
+    email: Notifier = field(default_factory=EmailNotifier)
+    sms: Notifier = field(default_factory=SMSNotifier)
+
+    def send_confirmation(self, customer_data):
+        contact_info = customer_data["contact_info"]
+        if "email" in contact_info:
+            self.email.send_confirmation(customer_data)
+        elif "phone" in contact_info:
+            self.sms.send_confirmation(customer_data)
+
+
+def build_service():
+    return PaymentService(
+        customer_validator=CustomerValidation(),
+        payment_validator=PaymentDataValidation(),
+        logger=TransactionLogger(),
+        payment_processor=CreditCardPaymentProcessor(),
+        notifier=ContactInfoNotifier(),
+    )
+
+
+def _minor_units(amount):
+    if isinstance(amount, float) and amount.is_integer():
+        return int(amount)
+    if isinstance(amount, str) and amount.strip().lstrip("-").isdigit():
+        return int(amount)
+    if isinstance(amount, int) and not isinstance(amount, bool):
+        return amount
+    raise ValueError(f"Amount must be a whole number of minor units: {amount!r}")
+
+
+def _from_flat(record):
+    contact_info = {}
+    if record.get("email"):
+        contact_info["email"] = record["email"]
+    if record.get("phone"):
+        contact_info["phone"] = record["phone"]
+
+    customer_data = {"name": record.get("name"), "contact_info": contact_info}
+    if record.get("id"):
+        customer_data["id"] = record["id"]
+
+    payment_data = {"amount": _minor_units(record.get("amount")), "source": record.get("source")}
+    return customer_data, payment_data
+
+
+def _parse_jsonl(line, header):
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError(f"Record is not a JSON object: {line[:80]}")
+    if "customer" in record:
+        payment_data = record["payment"]
+        payment_data["amount"] = _minor_units(payment_data.get("amount"))
+        return record["customer"], payment_data
+    return _from_flat(record)
+
+
+def _parse_csv(line, header):
+    values = next(csv.reader([line]))
+    return _from_flat(dict(zip(header, values)))
+
+
+# Yields (line_number, next_offset, customer_data, payment_data), or
+# (line_number, next_offset, None, error) for a line that cannot be parsed.
+# Line numbers go on from start_line, the number of the line before start_offset (the header
+# line of a CSV is not counted).
+def read_records(path, file_format, start_offset=0, start_line=0):
+    parse = _parse_jsonl if file_format == "jsonl" else _parse_csv
+    with open(path, "rb") as file:
+        header = None
+        if file_format == "csv":
+            first_line = file.readline().decode("utf-8")
+            header = [column.strip() for column in next(csv.reader([first_line]))]
+        if start_offset > file.tell():
+            file.seek(start_offset)
+
+        line_number = start_line
+        for raw_line in iter(file.readline, b""):
+            line_number += 1
+            if not raw_line.strip():
+                continue
+            try:
+                customer_data, payment_data = parse(raw_line.decode("utf-8").strip(), header)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                yield line_number, file.tell(), None, e
+                continue
+            yield line_number, file.tell(), customer_data, payment_data
+
+
+def chunked(records, chunk_size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Returns (offset, line). A checkpoint written before the line was saved is a bare offset.
+def read_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as file:
+            text = file.read().strip()
+        if text.startswith("{"):
+            checkpoint = json.loads(text)
+            return checkpoint["offset"], checkpoint["line"]
+        return int(text or 0), 0
+    return 0, 0
+
+
+def write_checkpoint(path, offset, line=0):
+    # Written to a temporary file and renamed, so a crash never leaves a half-written checkpoint.
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        file.write(json.dumps({"offset": offset, "line": line}))
+    os.replace(temporary, path)
+
+
+@dataclass
+class IngestStats:
+    succeeded: int = 0
+    failed: int = 0
+    unlogged: int = 0
+    offset: int = 0
+    line: int = 0
+
+
+def ingest(path, service, file_format=None, chunk_size=1000, checkpoint=None, resume=False, errors=None):
+    file_format = file_format or ("csv" if path.endswith(".csv") else "jsonl")
+    stats = IngestStats()
+    if resume:
+        stats.offset, stats.line = read_checkpoint(checkpoint)
+
+    for chunk in chunked(read_records(path, file_format, stats.offset, stats.line), chunk_size):
+        parsed = [record for record in chunk if record[2] is not None]
+        results = service.process_batch(
+            [(customer_data, payment_data) for _, _, customer_data, payment_data in parsed]
+        )
+
+        failures = [
+            (line_number, error)
+            for line_number, _, customer_data, error in chunk
+            if customer_data is None
+        ]
+        failures += [
+            (line_number, result.error)
+            for (line_number, _, _, _), result in zip(parsed, results)
+            if not result.ok
+        ]
+        unlogged = [
+            (line_number, result.log_error)
+            for (line_number, _, _, _), result in zip(parsed, results)
+            if result.ok and result.log_error is not None
+        ]
+        stats.succeeded += sum(result.ok for result in results) - len(unlogged)
+        stats.failed += len(failures)
+        stats.unlogged += len(unlogged)
+        if errors is not None:
+            rejected = [
+                {"line": line_number, "error": str(error)} for line_number, error in failures
+            ] + [
+                {"line": line_number, "error": str(error), "charged": True}
+                for line_number, error in unlogged
+            ]
+            for entry in sorted(rejected, key=lambda entry: entry["line"]):
+                errors.write(json.dumps(entry) + "\n")
+
+        stats.line, stats.offset = chunk[-1][0], chunk[-1][1]
+        if checkpoint:
+            write_checkpoint(checkpoint, stats.offset, stats.line)
+
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Stream payment records from a JSONL/CSV file through PaymentService."
+    )
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="default: from the file extension")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--checkpoint", help="file where the offset of the next record and the line number are saved")
+    parser.add_argument("--resume", action="store_true", help="start from the offset in --checkpoint")
+    parser.add_argument("--errors", help="write the rejected and the unlogged records (line and error) to this JSONL file")
+    parser.add_argument("--workers", type=int, default=0, help="process the chunks on N processes")
+    args = parser.parse_args(argv)
+
+    if args.workers:
+        from sharded_executor import ShardedPaymentExecutor
+        service = ShardedPaymentExecutor(service_factory=build_service, workers=args.workers)
+    else:
+        service = build_service()
+
+    errors = open(args.errors, "a") if args.errors else None
+    try:
+        stats = ingest(
+            args.path, service, args.format, args.chunk_size, args.checkpoint, args.resume, errors
+        )
+    finally:
+        if errors is not None:
+            errors.close()
+        if args.workers:
+            service.close()
+
+    print(
+        f"{stats.succeeded} succeeded, {stats.failed} failed, "
+        f"{stats.unlogged} charged but not logged, next offset {stats.offset}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
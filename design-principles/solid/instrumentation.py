@@ -0,0 +1,228 @@
+### --- Per-Stage Instrumentation --- ###
+
+# PaymentService.process_transaction runs five stages back to back:
+# customer validation, payment validation, charge, notification and logging.
+# Instrumentation times every stage and keeps, per stage:
+# - a latency histogram with fixed buckets (one integer counter per bucket, no list of samples)
+# - a counter of successes and a counter per error type
+
+# Timing costs one time.perf_counter_ns read per stage and a bucket update (the bucket is the
+# bit length of the duration, so no search), a few hundred nanoseconds per stage, so it can
+# stay always on (sample_every=1). With sample_every=N only one call in N is timed, the
+# others only pay for a small probe that counts the stages; successes and errors are always
+# counted.
+
+# The snapshot is sent to a pluggable MetricsExporter (print it, write JSON lines, or push
+# it to a monitoring system).
+
+# f_dip.PaymentService takes an optional `instrumentation` and runs its own stages with hooks:
+# it asks instrumentation.probe() for a Probe per transaction, calls probe.mark() at the end
+# of every stage, then probe.done(), or probe.fail(error) in the stage that raised. The
+# pipeline stays in the service, so instrumented and plain runs take the same path.
+# The successes of a stage are not counted on the hot path: they are derived in snapshot()
+# (completed transactions + transactions that failed in a later stage).
+
+import json
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+
+STAGES = ("customer_validation", "payment_validation", "charge", "notification", "logging")
+
+# Bucket i counts the durations d with d.bit_length() == i, that is 2**(i-1) <= d < 2**i ns.
+# int.bit_length() is much cheaper than a bisect over custom bounds.
+BUCKETS = 64
+
+
+@dataclass
+class Histogram:
+    counts: list = field(default_factory=lambda: [0] * BUCKETS)
+    total_ns: int = 0
+
+    def record(self, elapsed_ns):
+        self.counts[elapsed_ns.bit_length()] += 1
+        self.total_ns += elapsed_ns
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    # Upper bound (in ns) of the bucket that holds the given fraction of the samples.
+    def percentile(self, fraction):
+        target = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return 2 ** bucket
+        return 0
+
+    def to_dict(self):
+        return {
+            "counts": list(self.counts),
+            "count": self.count,
+            "mean_ns": self.total_ns / self.count if self.count else 0,
+            "p50_ns": self.percentile(0.50),
+            "p99_ns": self.percentile(0.99),
+        }
+
+
+class MetricsExporter(ABC):
+    @abstractmethod
+    def export(self, snapshot):
+        ...
+
+
+class PrintExporter(MetricsExporter):
+    def export(self, snapshot):
+        for stage, metrics in snapshot["stages"].items():
+            latency = metrics["latency"]
+            print(
+                f"{stage:<20} ok={metrics['successes']:<8} errors={metrics['errors']} "
+                f"p50<={latency['p50_ns'] / 1000:g}us p99<={latency['p99_ns'] / 1000:g}us"
+            )
+
+
+@dataclass
+class JSONLinesExporter(MetricsExporter):
+    path: str = "metrics.jsonl"
+
+    def export(self, snapshot):
+        with open(self.path, "a") as file:
+            file.write(json.dumps(snapshot) + "\n")
+
+
+@dataclass
+class StageMetrics:
+    latency: Histogram = field(default_factory=Histogram)
+    successes: int = 0
+    errors: dict = field(default_factory=dict)
+
+    def to_dict(self):
+        return {"latency": self.latency.to_dict(), "successes": self.successes, "errors": dict(self.errors)}
+
+
+@dataclass
+class Instrumentation:
+    exporter: MetricsExporter = field(default_factory=PrintExporter)
+    sample_every: int = 1
+
+    _histograms: tuple = field(init=False, repr=False, default=())
+    _errors: tuple = field(init=False, repr=False, default=())
+    _failures: list = field(init=False, repr=False, default=None)
+    _completed: int = field(init=False, repr=False, default=0)
+    _calls: int = field(init=False, repr=False, default=0)
+
+    def __post_init__(self):
+        self.reset()
+
+    def reset(self):
+        self._histograms = tuple(Histogram() for _ in STAGES)
+        self._errors = tuple({} for _ in STAGES)
+        self._failures = [0] * len(STAGES)
+        self._completed = 0
+        self._calls = 0
+
+    # A probe for one transaction. Every probe counts; one in sample_every also reads the clock.
+    def probe(self):
+        self._calls += 1
+        return Probe(self, [time.perf_counter_ns()] if not self._calls % self.sample_every else None)
+
+    def _record(self, marks):
+        previous = marks[0]
+        for histogram, now in zip(self._histograms, marks[1:]):
+            elapsed = now - previous
+            histogram.counts[elapsed.bit_length()] += 1
+            histogram.total_ns += elapsed
+            previous = now
+
+    def _count_error(self, stage, error):
+        self._failures[stage] += 1
+        errors = self._errors[stage]
+        name = type(error).__name__
+        errors[name] = errors.get(name, 0) + 1
+
+    @property
+    def stages(self):
+        stages = {}
+        failed_later = 0
+        for index in reversed(range(len(STAGES))):
+            stages[STAGES[index]] = StageMetrics(
+                latency=self._histograms[index],
+                successes=self._completed + failed_later,
+                errors=self._errors[index],
+            )
+            failed_later += self._failures[index]
+        return {name: stages[name] for name in STAGES}
+
+    def snapshot(self):
+        return {
+            "timestamp": time.time(),
+            "calls": self._calls,
+            "stages": {name: metrics.to_dict() for name, metrics in self.stages.items()},
+        }
+
+    def export(self):
+        self.exporter.export(self.snapshot())
+
+
+# marks is None when the transaction is not timed: the probe only keeps the stage it is in.
+@dataclass(slots=True)
+class Probe:
+    instrumentation: Instrumentation
+    marks: list = None
+    stage: int = 0
+
+    # End of the current stage. `elapsed` (ns) replaces the clock when the stage was shared
+    # by several transactions (the single log write of a batch).
+    def mark(self, elapsed=None):
+        marks = self.marks
+        if marks is not None:
+            marks.append(time.perf_counter_ns() if elapsed is None else marks[-1] + elapsed)
+        self.stage += 1
+
+    def done(self):
+        if self.marks is not None:
+            self.instrumentation._record(self.marks)
+        self.instrumentation._completed += 1
+
+    def fail(self, error, elapsed=None):
+        stage = self.stage
+        if self.marks is not None:
+            self.mark(elapsed)
+            self.instrumentation._record(self.marks)
+        self.instrumentation._count_error(stage, error)
+
+
+if __name__ == "__main__":
+    from f_dip import PaymentService
+    from b_srp import CustomerValidation, PaymentDataValidation, TransactionLogger
+    from c_ocp import CreditCardPaymentProcessor, EmailNotifier
+
+    instrumentation = Instrumentation()
+    payment_service = PaymentService(
+        customer_validator=CustomerValidation(),
+        payment_validator=PaymentDataValidation(),
+        logger=TransactionLogger(),
+        payment_processor=CreditCardPaymentProcessor(),
+        notifier=EmailNotifier(),
+        instrumentation=instrumentation,
+    )
+
+    customer_data_with_email = {
+        "name": "John Doe",
+        "contact_info": {"email": "e@mail.com"},
+    }
+    payment_data = {"amount": 500, "source": "tok_mastercard", "cvv": 123}
+
+    for _ in range(3):
+        payment_service.process_transaction(customer_data_with_email, payment_data)
+    try:
+        payment_service.process_transaction({"name": "John Doe"}, payment_data)
+    except ValueError:
+        pass
+    payment_service.process_batch(
+        [(customer_data_with_email, payment_data)] * 3 + [({"name": "John Doe"}, payment_data)]
+    )
+
+    instrumentation.export()
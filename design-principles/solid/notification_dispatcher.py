@@ -0,0 +1,161 @@
+### --- Notification Dispatcher --- ###
+
+# PaymentService calls notifier.send_confirmation inline, so the time to deliver the
+# email/SMS is part of the charge latency.
+
+# DispatchingNotifier is a Notifier that wraps another Notifier (EmailNotifier, SMSNotifier
+# from c_ocp.py or strategy.py). send_confirmation only puts the customer in a bounded
+# queue, and a pool of worker threads delivers the confirmations with the wrapped notifier.
+# The charge latency then depends only on the payment processor.
+
+# Backpressure: when the queue is full, send_confirmation waits up to put_timeout seconds
+# (None waits forever) and then raises queue.Full, so the caller can decide what to do.
+
+# metrics() reports the queue depth, sent/failed counts and the delivery latency
+# (time from send_confirmation until the wrapped notifier returns).
+# drain() stops accepting confirmations, delivers the queued ones and stops the workers.
+# A confirmation accepted before drain() is always queued before the workers are told to
+# stop, and drain(timeout) never waits longer than `timeout`, even when the queue is full.
+
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from c_ocp import Notifier
+from events import emit, ERROR
+
+_STOP = object()
+
+
+@dataclass
+class DispatchingNotifier(Notifier):
+    notifier: Notifier
+    workers: int = 4
+    max_queue: int = 10000
+    put_timeout: float = None
+
+    _queue: queue.Queue = field(init=False, repr=False, default=None)
+    _threads: list = field(init=False, repr=False, default_factory=list)
+    _lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+    _admission: threading.Condition = field(init=False, repr=False, default_factory=threading.Condition)
+    _accepting: bool = field(init=False, repr=False, default=True)
+    _submitting: int = field(init=False, repr=False, default=0)
+    _sent: int = field(init=False, repr=False, default=0)
+    _failed: int = field(init=False, repr=False, default=0)
+    _latency_total: float = field(init=False, repr=False, default=0.0)
+    _latency_max: float = field(init=False, repr=False, default=0.0)
+
+    def __post_init__(self):
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._run_worker, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def send_confirmation(self, customer_data):
+        with self._admission:
+            if not self._accepting:
+                raise ValueError("Notifier is draining, no more confirmations are accepted")
+            self._submitting += 1
+        try:
+            self._queue.put((customer_data, time.perf_counter()), timeout=self.put_timeout)
+        finally:
+            with self._admission:
+                self._submitting -= 1
+                if not self._submitting:
+                    self._admission.notify_all()
+
+    def metrics(self):
+        with self._lock:
+            delivered = self._sent + self._failed
+            return {
+                "queue_depth": self._queue.qsize(),
+                "sent": self._sent,
+                "failed": self._failed,
+                "avg_latency": self._latency_total / delivered if delivered else 0.0,
+                "max_latency": self._latency_max,
+            }
+
+    # Returns True when every queued confirmation was delivered before the timeout.
+    def drain(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def remaining():
+            return None if deadline is None else max(0, deadline - time.monotonic())
+
+        # Confirmations accepted before this point finish queueing before the stop markers.
+        with self._admission:
+            self._accepting = False
+            while self._submitting:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                self._admission.wait(remaining())
+
+        try:
+            for _ in self._threads:
+                self._queue.put(_STOP, timeout=remaining())
+        except queue.Full:
+            return False
+
+        for thread in self._threads:
+            thread.join(remaining())
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def _run_worker(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+
+            customer_data, queued_at = item
+            try:
+                self.notifier.send_confirmation(customer_data)
+                ok = True
+            except Exception as e:
+                emit(ERROR, "notification_failed", "Notification failed: {error}", error=e)
+                ok = False
+
+            latency = time.perf_counter() - queued_at
+            with self._lock:
+                if ok:
+                    self._sent += 1
+                else:
+                    self._failed += 1
+                self._latency_total += latency
+                self._latency_max = max(self._latency_max, latency)
+
+
+if __name__ == "__main__":
+    from f_dip import PaymentService
+    from b_srp import CustomerValidation, PaymentDataValidation, TransactionLogger
+    from c_ocp import CreditCardPaymentProcessor, EmailNotifier
+
+    notifier = DispatchingNotifier(EmailNotifier(), workers=2, max_queue=100)
+    payment_service = PaymentService(
+        customer_validator=CustomerValidation(),
+        payment_validator=PaymentDataValidation(),
+        logger=TransactionLogger(),
+        payment_processor=CreditCardPaymentProcessor(),
+        notifier=notifier,
+    )
+
+    customer_data_with_email = {
+        "name": "John Doe",
+        "contact_info": {"email": "e@mail.com"},
+    }
+    payment_data = {"amount": 500, "source": "tok_mastercard", "cvv": 123}
+
+    payment_service.process_batch([(customer_data_with_email, payment_data)] * 5)
+    notifier.drain()
+    print(notifier.metrics())
+
+    # A full queue and a stuck gateway: drain gives up after its timeout instead of blocking.
+    class StuckNotifier(Notifier):
+        def send_confirmation(self, customer_data):
+            time.sleep(1)
+
+    stuck = DispatchingNotifier(StuckNotifier(), workers=1, max_queue=2)
+    for _ in range(3):
+        stuck.send_confirmation(customer_data_with_email)
+    started = time.monotonic()
+    print(stuck.drain(timeout=0.2), f"after {time.monotonic() - started:.1f}s")
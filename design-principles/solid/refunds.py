@@ -0,0 +1,176 @@
+### --- Indexed Refunds --- ###
+
+# A refund has to find the original charge. With only transactions.log that means scanning
+# the whole file.
+
+# ChargeIndex keeps the settled charges in memory, indexed by charge id, by payment source
+# and by customer, so finding a charge is a dict lookup. The charge id is the one the charge
+# was created with (charge.id, also in the TransactionResult of process_batch), so the caller
+# can refund the charge it made.
+# IndexingTransactionLogger is a TransactionLogger that adds every logged charge to the
+# index and then passes it to the real logger, so any PaymentService fills the index
+# without changes.
+
+# IndexedRefundProcessor is a RefundProcessor (e_isp.py) that checks every refund against
+# the index (the charge exists, succeeded, and the amount is not more than what is left to
+# refund) before asking the gateway RefundProcessor to refund it.
+# refund_batch() takes a whole list of refunds (e.g. every charge of a bad merchant day,
+# found with index.find(source=...)) and reports a result per refund instead of stopping
+# at the first error.
+
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+from b_srp import TransactionLogger
+from charge import Status, new_charge_id
+from e_isp import RefundProcessor
+
+
+@dataclass
+class SettledCharge:
+    charge_id: str
+    customer_id: str
+    charge: object
+    refunded: int = 0
+    created: float = field(default_factory=time.time)
+
+    @property
+    def refundable(self):
+        return self.charge["amount"] - self.refunded
+
+
+@dataclass
+class ChargeIndex:
+    by_id: dict = field(default_factory=dict)
+    by_source: dict = field(default_factory=dict)
+    by_customer: dict = field(default_factory=dict)
+
+    def add(self, customer_data, charge, charge_id=None):
+        if charge_id is None:
+            charge_id = charge.get("id") or new_charge_id()
+        customer_id = customer_data.get("id", customer_data["name"])
+
+        settled = SettledCharge(charge_id=charge_id, customer_id=customer_id, charge=charge)
+        self.by_id[charge_id] = settled
+        self.by_source.setdefault(charge["source"], []).append(settled)
+        self.by_customer.setdefault(customer_id, []).append(settled)
+        return charge_id
+
+    def get(self, charge_id):
+        return self.by_id.get(charge_id)
+
+    def find(self, source=None, customer_id=None):
+        if source is not None and customer_id is not None:
+            return [
+                settled for settled in self.by_source.get(source, ())
+                if settled.customer_id == customer_id
+            ]
+        if source is not None:
+            return list(self.by_source.get(source, ()))
+        if customer_id is not None:
+            return list(self.by_customer.get(customer_id, ()))
+        return list(self.by_id.values())
+
+
+@dataclass
+class IndexingTransactionLogger(TransactionLogger):
+    index: ChargeIndex = field(default_factory=ChargeIndex)
+    logger: TransactionLogger = field(default_factory=TransactionLogger)
+
+    def log(self, customer_data, payment_data, charge):
+        self.index.add(customer_data, charge, payment_data.get("charge_id"))
+        self.logger.log(customer_data, payment_data, charge)
+
+    def log_batch(self, entries):
+        for customer_data, payment_data, charge in entries:
+            self.index.add(customer_data, charge, payment_data.get("charge_id"))
+        self.logger.log_batch(entries)
+
+
+@dataclass
+class RefundResult:
+    charge_id: str
+    amount: int = 0
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+@dataclass
+class IndexedRefundProcessor(RefundProcessor):
+    index: ChargeIndex
+    gateway: RefundProcessor
+
+    def refund_transaction(self, charge_id, amount=None):
+        settled = self.index.get(charge_id)
+        if settled is None:
+            raise ValueError(f"Unknown charge: {charge_id}")
+        if settled.charge["status"] not in (Status.SUCCEEDED, Status.REFUNDED):
+            raise ValueError(f"Charge {charge_id} is {settled.charge['status']}, it cannot be refunded")
+
+        if amount is None:
+            amount = settled.refundable
+        if amount <= 0:
+            raise ValueError(f"Invalid refund amount for {charge_id}: {amount}")
+        if amount > settled.refundable:
+            raise ValueError(
+                f"Refund of {amount} for {charge_id} exceeds the refundable {settled.refundable}"
+            )
+
+        self.gateway.refund_transaction(charge_id, amount)
+        settled.refunded += amount
+        if settled.refundable == 0:
+            settled.charge["status"] = Status.REFUNDED
+        return amount
+
+    # refunds is an iterable of (charge_id, amount); amount None refunds what is left.
+    # Like process_batch, a failing item (rejected refund, gateway error) is reported in its
+    # own result and the rest of the batch still runs.
+    def refund_batch(self, refunds):
+        results = []
+        for charge_id, amount in refunds:
+            try:
+                refunded = self.refund_transaction(charge_id, amount)
+            except Exception as e:
+                results.append(RefundResult(charge_id=charge_id, error=e))
+                continue
+            results.append(RefundResult(charge_id=charge_id, amount=refunded))
+        return results
+
+
+if __name__ == "__main__":
+    from f_dip import PaymentService
+    from b_srp import CustomerValidation, PaymentDataValidation
+    from c_ocp import EmailNotifier
+    from e_isp import CreditCardPaymentProcessor
+
+    index = ChargeIndex()
+    gateway = CreditCardPaymentProcessor()
+    payment_service = PaymentService(
+        customer_validator=CustomerValidation(),
+        payment_validator=PaymentDataValidation(),
+        logger=IndexingTransactionLogger(index=index),
+        payment_processor=gateway,
+        notifier=EmailNotifier(),
+    )
+
+    customer_data_with_email = {
+        "name": "John Doe",
+        "contact_info": {"email": "e@mail.com"},
+    }
+    results = payment_service.process_batch([
+        (customer_data_with_email, {"amount": 500, "source": "tok_mastercard"}),
+        (customer_data_with_email, {"amount": 300, "source": "tok_mastercard"}),
+        (customer_data_with_email, {"amount": 100, "source": "tok_visa"}),
+    ])
+
+    refunds = IndexedRefundProcessor(index=index, gateway=gateway)
+    charge_ids = [result.charge["id"] for result in results]
+    refunds.refund_transaction(charge_ids[0], 200)
+
+    # Reverse everything charged to tok_mastercard, one unknown charge and one malformed amount.
+    bad_day = [(settled.charge_id, None) for settled in index.find(source="tok_mastercard")]
+    for result in refunds.refund_batch(bad_day + [("ch_404", None), (charge_ids[2], "all")]):
+        print(result.charge_id, result.amount if result.ok else result.error)
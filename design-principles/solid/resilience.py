@@ -0,0 +1,319 @@
+### --- Resilient Processors and Notifiers --- ###
+
+# The processors in c_ocp.py and e_isp.py re-raise any exception at once, and PaymentService
+# waits for the gateway as long as it takes. A slow gateway keeps every worker waiting on it,
+# until the whole service has no free worker left.
+
+# ResilientPaymentProcessor / ResilientNotifier wrap any PaymentProcessor / Notifier:
+# - deadline: each call runs on a bounded thread pool and the caller waits at most `timeout`
+#   seconds in total (every attempt, retry and backoff included), then gets TimeoutError. The
+#   slow call keeps its pool thread, not the caller's; calls still queued are cancelled
+# - circuit breaker: after failure_threshold failures in a row the backend is "open" and
+#   calls fail at once with CircuitOpenError; after reset_timeout one probe call is let
+#   through ("half open"), its success closes the breaker again. A probe that is abandoned
+#   (the other backend answered first) lets the next call probe instead
+# - retries: failures in retry_on (connection errors) are retried up to max_retries times,
+#   waiting a random time between 0 and backoff * 2**attempt (full jitter). A RetryBudget
+#   shared by all calls limits retries to a fraction of the calls, so retries cannot multiply
+#   the load on a gateway that is already struggling
+# - hedging: with a `secondary`, if the primary has not answered after hedge_after seconds (or
+#   has failed), the same call is also sent to the secondary and the first answer is used
+
+# Other exceptions (e.g. the ValueError of a declined card) are the answer of a healthy
+# backend: they are raised at once, never retried and do not open the breaker.
+
+# Retries and hedged calls can reach the gateway twice, and a call that timed out may still
+# complete. ResilientPaymentProcessor therefore does not retry by default (max_retries=0) and
+# only hedges when hedge_after is set: enable them only for processors that are idempotent,
+# e.g. gateways that deduplicate by an idempotency key.
+
+# FakeGateway is a PaymentProcessor and Notifier that injects latency and faults, to try the
+# wrappers locally.
+
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from c_ocp import Notifier, PaymentProcessor
+from charge import Charge, Currency
+from events import emit, WARNING
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+@dataclass
+class CircuitBreaker:
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+
+    state: str = field(init=False, default=CLOSED)
+    _failures: int = field(init=False, repr=False, default=0)
+    _opened_at: float = field(init=False, repr=False, default=0.0)
+    _probing: bool = field(init=False, repr=False, default=False)
+    _lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+
+    def allow(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    # The call was cancelled or its answer ignored: it says nothing about the backend, but a
+    # probe must not hold the half-open breaker forever.
+    def record_abandoned(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    emit(WARNING, "circuit_opened", "Circuit opened after {failures} failures", failures=self._failures)
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+# Every call deposits `ratio` tokens (up to `capacity`), every retry spends one.
+@dataclass
+class RetryBudget:
+    ratio: float = 0.1
+    capacity: float = 10.0
+
+    _tokens: float = field(init=False, repr=False, default=None)
+    _lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+
+    def __post_init__(self):
+        self._tokens = self.capacity
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+@dataclass
+class _Resilient:
+    timeout: float = 5.0
+    max_retries: int = 2
+    backoff: float = 0.05
+    retry_on: tuple = (ConnectionError,)
+    hedge_after: float = None
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+    secondary_breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+    budget: RetryBudget = field(default_factory=RetryBudget)
+    max_workers: int = 32
+
+    _pool: ThreadPoolExecutor = field(init=False, repr=False, default=None)
+
+    def __post_init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+    def _call(self, method, *args):
+        self.budget.deposit()
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(method, args, deadline)
+            except self.retry_on:
+                if attempt >= self.max_retries or not self.budget.withdraw():
+                    raise
+                pause = random.uniform(0, self.backoff * 2 ** attempt)
+                if time.monotonic() + pause >= deadline:
+                    raise
+                time.sleep(pause)
+                attempt += 1
+
+    def _attempt(self, method, args, deadline):
+        secondary = getattr(self, "secondary", None)
+        running = {}
+
+        if self.breaker.allow():
+            running[self._pool.submit(getattr(self.primary, method), *args)] = self.breaker
+            hedge_at = None if secondary is None or self.hedge_after is None else time.monotonic() + self.hedge_after
+        elif secondary is None:
+            raise CircuitOpenError(f"{type(self.primary).__name__} is unavailable")
+        else:
+            hedge_at = time.monotonic()
+        hedged = secondary is None
+
+        error = None
+        while True:
+            now = time.monotonic()
+            if not hedged and (not running or (hedge_at is not None and now >= hedge_at)):
+                hedged = True
+                if self.secondary_breaker.allow():
+                    running[self._pool.submit(getattr(secondary, method), *args)] = self.secondary_breaker
+            if not running:
+                raise error or CircuitOpenError("No backend is available")
+            if now >= deadline:
+                for future, breaker in running.items():
+                    future.cancel()
+                    breaker.record_failure()
+                raise TimeoutError(f"No answer after {self.timeout} seconds")
+
+            wake = deadline if hedged or hedge_at is None else min(deadline, hedge_at)
+            done, _ = wait(running, timeout=wake - now, return_when=FIRST_COMPLETED)
+            for future in done:
+                breaker = running.pop(future)
+                try:
+                    result = future.result()
+                except self.retry_on as e:
+                    breaker.record_failure()
+                    error = e
+                    continue
+                except Exception:
+                    breaker.record_success()
+                    self._abandon(running)
+                    raise
+                breaker.record_success()
+                self._abandon(running)
+                return result
+
+    @staticmethod
+    def _abandon(running):
+        for future, breaker in running.items():
+            future.cancel()
+            breaker.record_abandoned()
+
+
+@dataclass
+class ResilientPaymentProcessor(_Resilient, PaymentProcessor):
+    max_retries: int = 0
+    primary: PaymentProcessor = None
+    secondary: PaymentProcessor = None
+
+    def process_transaction(self, customer_data, payment_data):
+        return self._call("process_transaction", customer_data, payment_data)
+
+
+@dataclass
+class ResilientNotifier(_Resilient, Notifier):
+    primary: Notifier = None
+    secondary: Notifier = None
+
+    def send_confirmation(self, customer_data):
+        return self._call("send_confirmation", customer_data)
+
+
+# latency: seconds per call; slow_rate of the calls take slow_latency instead (the tail);
+# failure_rate of the calls raise ConnectionError. `down` makes every call fail.
+@dataclass
+class FakeGateway(PaymentProcessor, Notifier):
+    latency: float = 0.001
+    slow_rate: float = 0.0
+    slow_latency: float = 1.0
+    failure_rate: float = 0.0
+    down: bool = False
+    seed: int = None
+
+    calls: int = field(init=False, default=0)
+    _random: random.Random = field(init=False, repr=False, default=None)
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+
+    def _respond(self):
+        self.calls += 1
+        slow = self._random.random() < self.slow_rate
+        fail = self.down or self._random.random() < self.failure_rate
+        time.sleep(self.slow_latency if slow else self.latency)
+        if fail:
+            raise ConnectionError("Gateway unavailable")
+
+    def process_transaction(self, customer_data, payment_data):
+        self._respond()
+        return Charge(
+            amount=payment_data["amount"],
+            source=payment_data["source"],
+            description=customer_data["name"],
+            currency=payment_data.get("currency", Currency.USD),
+        )
+
+    def send_confirmation(self, customer_data):
+        self._respond()
+
+
+if __name__ == "__main__":
+    customer_data = {"name": "John Doe", "contact_info": {"email": "e@mail.com"}}
+    payment_data = {"amount": 500, "source": "tok_mastercard"}
+
+    def p99(processor, calls=200):
+        latencies = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            processor.process_transaction(customer_data, payment_data)
+            latencies.append(time.perf_counter() - started)
+        return sorted(latencies)[int(calls * 0.99)] * 1000
+
+    # A gateway whose slowest 5% of calls take 200ms, hedged after 10ms to a second gateway.
+    tail = dict(latency=0.001, slow_rate=0.05, slow_latency=0.2)
+    print(f"p99 without hedging: {p99(FakeGateway(**tail, seed=1)):.1f} ms")
+    hedged = ResilientPaymentProcessor(
+        primary=FakeGateway(**tail, seed=1), secondary=FakeGateway(**tail, seed=2), hedge_after=0.01
+    )
+    print(f"p99 with hedging:    {p99(hedged):.1f} ms")
+
+    # A gateway that is down: the breaker opens and the next calls fail without waiting.
+    resilient = ResilientPaymentProcessor(
+        primary=FakeGateway(latency=0.05, down=True),
+        timeout=0.5,
+        breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60),
+    )
+    for _ in range(5):
+        started = time.perf_counter()
+        try:
+            resilient.process_transaction(customer_data, payment_data)
+        except (ConnectionError, CircuitOpenError) as e:
+            print(f"{type(e).__name__} after {(time.perf_counter() - started) * 1000:.0f} ms, breaker {resilient.breaker.state}")
+    print("gateway calls:", resilient.primary.calls)
+
+    # The primary recovers while the secondary keeps winning the hedge: the abandoned probes
+    # do not hold the breaker half open, and once the primary is fast again it closes.
+    recovering = ResilientPaymentProcessor(
+        primary=FakeGateway(latency=0.001, down=True),
+        secondary=FakeGateway(latency=0.001),
+        hedge_after=0.01,
+        breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05),
+    )
+    recovering.process_transaction(customer_data, payment_data)
+    recovering.primary.down, recovering.primary.latency = False, 0.05
+    time.sleep(0.1)
+    recovering.process_transaction(customer_data, payment_data)
+    print("after an abandoned probe, breaker", recovering.breaker.state)
+    recovering.primary.latency = 0.001
+    calls = recovering.primary.calls
+    recovering.process_transaction(customer_data, payment_data)
+    assert recovering.primary.calls > calls and recovering.breaker.state == CLOSED
+    print("primary healthy again, breaker", recovering.breaker.state)
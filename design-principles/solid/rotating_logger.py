@@ -0,0 +1,329 @@
+### --- Rotating Transaction Logger --- ###
+
+# TransactionLogger in b_srp.py appends to one transactions.log forever, so the file only grows
+# and a question like "total paid per customer today" has to read all of it.
+
+# RotatingTransactionLogger writes the same two lines per transaction, but into segments:
+#   <directory>/transactions.000001.log, transactions.000002.log, ...
+# - the open segment is closed and a new one started when it reaches max_bytes, or when it is
+#   older than max_age seconds (checked on every write and by the background thread, so a
+#   quiet logger still rotates on time; a segment with no record is not rotated, its clock
+#   restarts instead)
+# - when a segment is closed, its summary is written next to it (transactions.000001.summary.json):
+#   count, sum, min and max amount per (customer, status, currency), plus the time range of the
+#   segment. Amounts are in the minor units of their currency and are never added across currencies
+# - a background thread then compresses the closed segment (transactions.000001.log.gz)
+
+# The logger keeps the summary of the open segment in memory while it writes, so closing a
+# segment never reads it back. logger.aggregate() answers queries from the summaries of the
+# closed segments and the in-memory totals of the open one, so records still in the write
+# buffer are counted; the compressed files are never read. The module function aggregate()
+# is for other processes: it scans the open segment, so it sees what the logger has flushed.
+# The time range is per segment, so `since` filters whole segments: choose max_age to match
+# the precision the dashboards need.
+
+# Segments left open by a previous run (no summary yet) are summarized and compressed when the
+# logger starts. Like BufferedTransactionLogger, it is a TransactionLogger: in b_srp and c_ocp
+# replace it with service.logger = RotatingTransactionLogger(), and close() it on shutdown.
+
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from b_srp import TransactionLogger
+from events import emit, ERROR
+
+_SEGMENT = re.compile(r"^transactions\.(\d+)\.log$")
+_STOP = object()
+
+
+def _segment_path(directory, number):
+    return os.path.join(directory, f"transactions.{number:06d}.log")
+
+
+def _summary_path(directory, number):
+    return os.path.join(directory, f"transactions.{number:06d}.summary.json")
+
+
+def _add(totals, key, amount):
+    entry = totals.get(key)
+    if entry is None:
+        totals[key] = {"count": 1, "sum": amount, "min": amount, "max": amount}
+    else:
+        entry["count"] += 1
+        entry["sum"] += amount
+        if amount < entry["min"]:
+            entry["min"] = amount
+        if amount > entry["max"]:
+            entry["max"] = amount
+
+
+def _merge(totals, key, other):
+    entry = totals.get(key)
+    if entry is None:
+        totals[key] = dict(other)
+    else:
+        entry["count"] += other["count"]
+        entry["sum"] += other["sum"]
+        entry["min"] = min(entry["min"], other["min"])
+        entry["max"] = max(entry["max"], other["max"])
+
+
+def _parse_amount(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+# Builds the summary of a segment from its text ("<name> paid <amount> <currency>" /
+# "Payment status: <status>"). Lines written before the currency was logged are usd.
+def scan_segment(path):
+    totals = {}
+    with open(path) as file:
+        paid = None
+        for line in file:
+            line = line.rstrip("\n")
+            if paid is None:
+                customer, separator, paid_text = line.rpartition(" paid ")
+                if separator:
+                    amount, _, currency = paid_text.partition(" ")
+                    paid = customer, _parse_amount(amount), currency or "usd"
+            elif line.startswith("Payment status: "):
+                customer, amount, currency = paid
+                _add(totals, (customer, line[len("Payment status: "):], currency), amount)
+                paid = None
+    return totals
+
+
+def write_summary(path, totals, started, ended):
+    summary = {
+        "started": started,
+        "ended": ended,
+        "totals": [
+            {"customer": customer, "status": status, "currency": currency, **entry}
+            for (customer, status, currency), entry in totals.items()
+        ],
+    }
+    # Written to a temporary file and renamed, so a reader never sees half a summary.
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        json.dump(summary, file)
+    os.replace(temporary, path)
+
+
+def read_summary(path):
+    with open(path) as file:
+        summary = json.load(file)
+    totals = {
+        (entry.pop("customer"), entry.pop("status"), entry.pop("currency", "usd")): entry
+        for entry in summary["totals"]
+    }
+    return summary["started"], summary["ended"], totals
+
+
+# Totals per (customer, status, currency) over every segment that ended at or after `since`
+# (every segment when since is None), except the segment numbers in `skip`. Only summaries
+# and the open segment are read.
+def aggregate(directory="transactions", since=None, skip=()):
+    totals = {}
+    for name in sorted(os.listdir(directory)):
+        match = re.match(r"^transactions\.(\d+)\.(summary\.json|log)$", name)
+        if not match:
+            continue
+        number = int(match.group(1))
+        if number in skip:
+            continue
+        if match.group(2) == "summary.json":
+            _, ended, segment_totals = read_summary(os.path.join(directory, name))
+            if since is not None and ended < since:
+                continue
+        elif os.path.exists(_summary_path(directory, number)):
+            continue  # closed, waiting for compression: its summary is counted
+        else:
+            segment_totals = scan_segment(os.path.join(directory, name))
+        for key, entry in segment_totals.items():
+            _merge(totals, key, entry)
+    return totals
+
+
+@dataclass
+class RotatingTransactionLogger(TransactionLogger):
+    directory: str = "transactions"
+    max_bytes: int = 64 * 1024 * 1024
+    max_age: float = 3600.0
+    compress: bool = True
+
+    _file: object = field(init=False, repr=False, default=None)
+    _number: int = field(init=False, repr=False, default=0)
+    _size: int = field(init=False, repr=False, default=0)
+    _started: float = field(init=False, repr=False, default=0.0)
+    _totals: dict = field(init=False, repr=False, default_factory=dict)
+    _lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+    _closed_segments: queue.Queue = field(init=False, repr=False, default_factory=queue.Queue)
+    _compressor: threading.Thread = field(init=False, repr=False, default=None)
+
+    def __post_init__(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._compressor = threading.Thread(target=self._run_compressor, daemon=True)
+        self._compressor.start()
+
+        numbers = sorted(
+            int(match.group(1))
+            for match in map(_SEGMENT.match, os.listdir(self.directory))
+            if match
+        )
+        for number in numbers:
+            path = _segment_path(self.directory, number)
+            summary = _summary_path(self.directory, number)
+            if not os.path.exists(summary):
+                modified = os.path.getmtime(path)
+                write_summary(summary, scan_segment(path), modified, modified)
+            self._closed_segments.put(path)
+
+        existing = [
+            int(name.split(".")[1])
+            for name in os.listdir(self.directory)
+            if name.startswith("transactions.") and name.split(".")[1].isdigit()
+        ]
+        self._open_segment(max(existing, default=0) + 1)
+
+    def log(self, customer_data, payment_data, charge):
+        self.log_batch([(customer_data, payment_data, charge)])
+
+    def log_batch(self, entries):
+        records = []
+        with self._lock:
+            if self._file is None:
+                raise ValueError("Logger is closed")
+            totals = self._totals
+            for customer_data, payment_data, charge in entries:
+                customer, status = customer_data["name"], f"{charge['status']}"
+                amount, currency = charge["amount"], f"{charge['currency']}"
+                records.append(f"{customer} paid {amount} {currency}\nPayment status: {status}\n")
+                _add(totals, (customer, status, currency), amount)
+            text = "".join(records)
+            self._file.write(text)
+            self._size += len(text)
+            if self._size >= self.max_bytes or time.time() - self._started >= self.max_age:
+                self._rotate()
+
+    # Totals per (customer, status, currency) of the open segment, from memory.
+    def open_totals(self):
+        with self._lock:
+            return {key: dict(entry) for key, entry in self._totals.items()}
+
+    # Like aggregate(), with the open segment counted from memory (buffered records included).
+    # Only the copy of the open segment's totals is made under the lock; the summaries are
+    # read after it, so a query does not hold up log_batch. The open segment is skipped by
+    # number: if it is rotated in the meantime, its summary is skipped too (its totals are in
+    # the copy), and the records of the next segment are simply newer.
+    def aggregate(self, since=None):
+        with self._lock:
+            skip = {self._number} if self._file else ()
+            totals = {key: dict(entry) for key, entry in self._totals.items()}
+        for key, entry in aggregate(self.directory, since, skip).items():
+            _merge(totals, key, entry)
+        return totals
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def rotate(self):
+        with self._lock:
+            self._rotate()
+
+    # Closes the open segment (with its summary) and waits for the compression to finish.
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._close_segment()
+            self._file = None
+        self._closed_segments.put(_STOP)
+        self._compressor.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _open_segment(self, number):
+        self._number = number
+        self._file = open(_segment_path(self.directory, number), "a")
+        self._size = 0
+        self._started = time.time()
+        self._totals = {}
+
+    def _close_segment(self):
+        self._file.close()
+        write_summary(
+            _summary_path(self.directory, self._number), self._totals, self._started, time.time()
+        )
+        self._closed_segments.put(_segment_path(self.directory, self._number))
+
+    def _rotate(self):
+        self._close_segment()
+        self._open_segment(self._number + 1)
+
+    # Seconds until the open segment is max_age old.
+    def _until_rotation(self):
+        with self._lock:
+            if self._file is None:
+                return self.max_age
+            return max(0.0, self._started + self.max_age - time.time())
+
+    def _rotate_if_old(self):
+        with self._lock:
+            if self._file is None or time.time() - self._started < self.max_age:
+                return
+            if not self._size:
+                self._started = time.time()
+                return
+            try:
+                self._rotate()
+            except OSError as e:
+                emit(ERROR, "rotation_failed", "Rotation of {directory} failed: {error}", directory=self.directory, error=e)
+
+    # Compresses the closed segments and, between them, rotates the open one when it gets too old.
+    def _run_compressor(self):
+        while True:
+            try:
+                path = self._closed_segments.get(timeout=self._until_rotation())
+            except queue.Empty:
+                self._rotate_if_old()
+                continue
+            if path is _STOP:
+                return
+            if not self.compress:
+                continue
+            try:
+                with open(path, "rb") as source, gzip.open(path + ".gz", "wb") as target:
+                    shutil.copyfileobj(source, target)
+                os.remove(path)
+            except OSError as e:
+                emit(ERROR, "compression_failed", "Compression of {path} failed: {error}", path=path, error=e)
+
+
+if __name__ == "__main__":
+    from charge import Charge
+
+    with RotatingTransactionLogger(directory="transactions", max_bytes=200) as logger:
+        for number in range(12):
+            customer_data = {"name": f"Customer {number % 3}", "contact_info": {}}
+            payment_data = {"amount": 100 * (number + 1), "source": "tok_visa", "currency": ("usd", "jpy")[number % 2]}
+            charge = Charge(payment_data["amount"], "tok_visa", customer_data["name"], payment_data["currency"])
+            logger.log(customer_data, payment_data, charge)
+
+        for (customer, status, currency), entry in sorted(logger.aggregate().items()):
+            print(customer, status, currency, entry)
+
+    print(sorted(os.listdir("transactions")))
@@ -0,0 +1,261 @@
+### --- Schema Validation --- ###
+
+# CustomerValidation and PaymentDataValidation (b_srp.py) are hand-written dict.get checks
+# that stop at the first failure.
+
+# Here the rules are declared once as a Schema (a list of Field) and the schema is
+# compiled into a single Python function: the checks are generated as source code and
+# built with exec, the same way dataclasses builds __init__. The compiled function has no
+# loops or per-rule calls, just one `if` per field, with the messages as literal constants.
+# With several fields, it starts with a fast path for valid data: one `if` that tests every
+# field at once, reading required fields with data[name] (no method call), inside a try
+# block (free in Python 3.11 when nothing is raised). Only when it fails, a missing key
+# included, the fields are checked one by one to raise the message of the first invalid one.
+# Each check holds only the tests its rule needs: the truthiness test already rejects None,
+# and the amount test does not repeat the isinstance of the type check. The types and
+# isinstance are closure variables of the function, not global lookups.
+
+# A schema can also validate a whole batch column by column: validate_columns() builds a
+# boolean mask per rule (True = row is invalid) and reports every invalid row with all of
+# its errors, instead of raising on the first one.
+
+# SchemaCustomerValidation and SchemaPaymentDataValidation, with the default CUSTOMER_SCHEMA
+# and PAYMENT_SCHEMA, are drop-in replacements for the b_srp validators for any PaymentService:
+# same rules and ValueError messages (without the invalid_customer / invalid_payment events),
+# at least as fast (see the timings of the demo).
+# STRICT_PAYMENT_SCHEMA also checks the types and that the amount is a positive number; it
+# rejects payments that b_srp accepts, so it is opt-in:
+# SchemaPaymentDataValidation(schema=STRICT_PAYMENT_SCHEMA).
+
+from dataclasses import dataclass, field
+from b_srp import CustomerValidation, PaymentDataValidation
+
+
+@dataclass(frozen=True)
+class Field:
+    name: str
+    message: str
+    required: bool = True
+    types: tuple = None
+    positive: bool = False
+
+    @property
+    def numeric(self):
+        return self.types is not None and all(issubclass(kind, (int, float)) for kind in self.types)
+
+    # Python expression over `value`, True when the value is invalid (None: no check).
+    # `types` is the name the type (or tuple of types) is bound to in the compiled function.
+    def condition(self, types):
+        checks = []
+        if self.required:
+            checks.append("not value")
+        if self.types is not None:
+            checks.append(f"not isinstance(value, {types})")
+        if self.positive:
+            checks.append("value <= 0" if self.numeric else "(isinstance(value, (int, float)) and value <= 0)")
+        if not checks:
+            return None
+        if self.required:
+            return " or ".join(checks)
+        return f"value is not None and ({' or '.join(checks)})"
+
+    # Fast path expression, True when the field is valid (None: always valid). A missing
+    # required field raises KeyError. The value is assigned to the variable `value`.
+    def valid(self, types, value):
+        tests = []
+        if self.types is not None:
+            tests.append(f"isinstance({value}, {types})")
+        if self.positive:
+            tests.append(f"{value} > 0" if self.numeric else f"(not isinstance({value}, (int, float)) or {value} > 0)")
+        if self.required:
+            if not tests:
+                return f"data[{self.name!r}]"
+            return " and ".join([f"({value} := data[{self.name!r}])"] + tests)
+        if not tests:
+            return None
+        return f"({value} := data.get({self.name!r})) is None or ({' and '.join(tests)})"
+
+
+@dataclass
+class Schema:
+    fields: list
+
+    # compiled(validator, data): the first argument is unused, so the function can be the
+    # validate method of a class.
+    compiled: object = field(init=False, repr=False, default=None)
+    _classes: dict = field(init=False, repr=False, compare=False, default_factory=dict)
+
+    def __post_init__(self):
+        self.compiled = self._compile()
+
+    def validate(self, data):
+        self.compiled(self, data)
+
+    # Subclass of `base` whose validate method is the compiled function (one per base class).
+    def validator_class(self, base):
+        if base not in self._classes:
+            self._classes[base] = type(base.__name__, (base,), {"validate": self.compiled})
+        return self._classes[base]
+
+    def _compile(self):
+        bound = {"isinstance": isinstance}
+        fast = []
+        body = []
+        for number, rule in enumerate(self.fields):
+            types = f"types_{number}"
+            condition = rule.condition(types)
+            if condition is None:
+                continue
+            if rule.types is not None:
+                bound[types] = rule.types[0] if len(rule.types) == 1 else rule.types
+            fast.append(f"({rule.valid(types, f'value_{number}')})")
+            if condition == "not value":
+                body.append(f"        if not data.get({rule.name!r}):")
+            else:
+                body.append(f"        value = data.get({rule.name!r})")
+                body.append(f"        if {condition}:")
+            body.append(f"            raise ValueError({rule.message!r})")
+
+        # Like dataclasses, the function is created inside a factory whose arguments become
+        # its closure variables.
+        lines = [f"def create({', '.join(bound)}):", "    def validate(self, data):"]
+        # With a single field the fast path would only repeat the check.
+        if len(fast) > 1:
+            lines += [
+                "        try:",
+                f"            if {' and '.join(fast)}:",
+                "                return None",
+                "        except KeyError:",
+                "            pass",
+            ]
+        lines += body
+        lines += ["        return None", "    return validate"]
+        namespace = {}
+        exec("\n".join(lines), namespace)
+        return namespace["create"](**bound)
+
+    # columns maps each field name to the list of its values (one per row).
+    # Returns {row number: [error messages]} for every invalid row.
+    def validate_columns(self, columns):
+        rows = len(next(iter(columns.values()))) if columns else 0
+        errors = {}
+        for rule in self.fields:
+            values = columns.get(rule.name, [None] * rows)
+            for row, invalid in enumerate(self._mask(rule, values)):
+                if invalid:
+                    errors.setdefault(row, []).append(rule.message)
+        return errors
+
+    def validate_rows(self, rows):
+        rows = list(rows)
+        columns = {rule.name: [row.get(rule.name) for row in rows] for rule in self.fields}
+        return self.validate_columns(columns)
+
+    @staticmethod
+    def _mask(rule, values):
+        mask = [False] * len(values)
+        if rule.required:
+            mask = [invalid or not value for invalid, value in zip(mask, values)]
+        if rule.types is not None:
+            mask = [
+                invalid or (value is not None and not isinstance(value, rule.types))
+                for invalid, value in zip(mask, values)
+            ]
+        if rule.positive:
+            mask = [
+                invalid or (isinstance(value, (int, float)) and value <= 0)
+                for invalid, value in zip(mask, values)
+            ]
+        return mask
+
+
+# The rules of b_srp.CustomerValidation and b_srp.PaymentDataValidation.
+CUSTOMER_SCHEMA = Schema([
+    Field("name", "Invalid customer data: missing name"),
+    Field("contact_info", "Invalid customer data: missing contact info"),
+])
+
+PAYMENT_SCHEMA = Schema([
+    Field("source", "Invalid payment data"),
+])
+
+STRICT_CUSTOMER_SCHEMA = Schema([
+    Field("name", "Invalid customer data: missing name", types=(str,)),
+    Field("contact_info", "Invalid customer data: missing contact info", types=(dict,)),
+])
+
+STRICT_PAYMENT_SCHEMA = Schema([
+    Field("source", "Invalid payment data", types=(str,)),
+    Field("amount", "Invalid payment data: amount must be a positive number",
+          types=(int, float), positive=True),
+])
+
+
+# validate is the compiled function itself, as a method of the class: a call costs what the
+# b_srp method call costs. With another schema, the instance becomes an instance of the
+# schema's subclass (validator_class); a validate stored on the instance would instead slow
+# down the method lookup of every instance of the class.
+@dataclass
+class SchemaCustomerValidation(CustomerValidation):
+    schema: Schema = field(default_factory=lambda: CUSTOMER_SCHEMA)
+
+    validate = CUSTOMER_SCHEMA.compiled
+
+    def __post_init__(self):
+        if self.schema is not CUSTOMER_SCHEMA:
+            self.__class__ = self.schema.validator_class(SchemaCustomerValidation)
+
+
+@dataclass
+class SchemaPaymentDataValidation(PaymentDataValidation):
+    schema: Schema = field(default_factory=lambda: PAYMENT_SCHEMA)
+
+    validate = PAYMENT_SCHEMA.compiled
+
+    def __post_init__(self):
+        if self.schema is not PAYMENT_SCHEMA:
+            self.__class__ = self.schema.validator_class(SchemaPaymentDataValidation)
+
+
+if __name__ == "__main__":
+    import random
+    import timeit
+
+    customer_validator = SchemaCustomerValidation()
+    payment_validator = SchemaPaymentDataValidation()
+
+    customer_validator.validate({"name": "John Doe", "contact_info": {"email": "e@mail.com"}})
+    payment_validator.validate({"amount": 500, "source": "tok_mastercard", "cvv": 123})
+
+    try:
+        customer_validator.validate({"name": "John Doe"})
+    except ValueError as e:
+        print(e)
+
+    errors = STRICT_PAYMENT_SCHEMA.validate_rows([
+        {"amount": 500, "source": "tok_mastercard"},
+        {"amount": -1, "source": ""},
+        {"source": "tok_visa"},
+    ])
+    for row, messages in errors.items():
+        print(f"row {row}: {messages}")
+
+    # Valid data. The validators are timed in turn, in a random order, 15 rounds, and the
+    # median is printed: a slow moment of the machine hits all of them alike.
+    customer_data = {"name": "John Doe", "contact_info": {"email": "e@mail.com"}}
+    payment_data = {"amount": 500, "source": "tok_mastercard", "cvv": 123}
+    timed = {
+        "b_srp customer": (CustomerValidation(), customer_data),
+        "schema customer": (customer_validator, customer_data),
+        "b_srp payment": (PaymentDataValidation(), payment_data),
+        "schema payment": (payment_validator, payment_data),
+        "strict payment": (SchemaPaymentDataValidation(schema=STRICT_PAYMENT_SCHEMA), payment_data),
+    }
+    times = {label: [] for label in timed}
+    for _ in range(15):
+        for label in random.sample(list(timed), len(timed)):
+            validator, data = timed[label]
+            timer = timeit.Timer("validator.validate(data)", globals={"validator": validator, "data": data})
+            times[label].append(timer.timeit(100_000) / 100_000)
+    for label, samples in times.items():
+        print(f"{label}: {sorted(samples)[len(samples) // 2] * 1e9:.0f} ns")
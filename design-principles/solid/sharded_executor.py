@@ -0,0 +1,195 @@
+### --- Sharded Multi-Process Executor --- ###
+
+# Because of the GIL, one Python process running PaymentService uses one core for the
+# CPU-bound parts (validation, building the charge, formatting).
+
+# ShardedPaymentExecutor runs one worker process per shard. Each worker builds its own
+# PaymentService (f_dip.py) with `service_factory`, so the dependencies are still injected;
+# the factory must be a top-level function so it can be sent to the worker processes.
+
+# - Transactions are assigned to a shard by a hash of the customer, and every shard runs its
+#   transactions one after the other, so the order of each customer's transactions is kept.
+# - Each shard receives its transactions as one list (one pickle per batch, not per item),
+#   and returns one list of TransactionResult.
+# - The workers do not write the transaction log. The parent merges the results back into
+#   input order and logs the successful charges with its own logger, in that same order.
+# - A shard that fails (e.g. its worker process died) only fails its own items: each gets a
+#   TransactionResult with the error, the charges of the other shards are still logged, and
+#   a broken shard pool is replaced so the next batches of its customers can run. Whether the
+#   items of the failed shard were charged before it died is unknown, check the gateway.
+
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from b_srp import CustomerValidation, PaymentDataValidation, TransactionLogger
+from c_ocp import CreditCardPaymentProcessor, EmailNotifier
+from f_dip import PaymentService, TransactionResult
+from events import get_sink
+
+
+def default_service_factory():
+    return PaymentService(
+        customer_validator=CustomerValidation(),
+        payment_validator=PaymentDataValidation(),
+        logger=TransactionLogger(),
+        payment_processor=CreditCardPaymentProcessor(),
+        notifier=EmailNotifier(),
+    )
+
+
+def shard_of(customer_data, shards):
+    customer_id = str(customer_data.get("id", customer_data.get("name", "")))
+    return zlib.crc32(customer_id.encode("utf-8")) % shards
+
+
+# Logging is done by the parent, so the workers use a logger that writes nothing.
+class _NullLogger(TransactionLogger):
+    def log(self, customer_data, payment_data, charge):
+        pass
+
+    def log_batch(self, entries):
+        pass
+
+
+_worker_service = None
+
+
+def _init_worker(service_factory):
+    global _worker_service
+    _worker_service = service_factory()
+    _worker_service.logger = _NullLogger()
+
+
+def _run_shard(pairs):
+    results = _worker_service.process_batch(pairs)
+    # Worker processes exit without running atexit, so their events are written here.
+    get_sink().flush()
+    return results
+
+
+@dataclass
+class ShardedPaymentExecutor:
+    service_factory: object = default_service_factory
+    logger: TransactionLogger = field(default_factory=TransactionLogger)
+    workers: int = field(default_factory=lambda: os.cpu_count() or 1)
+
+    _shards: list = field(init=False, repr=False, default_factory=list)
+
+    def __post_init__(self):
+        # One single-process pool per shard: a shard runs its batches strictly in order.
+        self._shards = [self._new_pool() for _ in range(self.workers)]
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=1, initializer=_init_worker, initargs=(self.service_factory,)
+        )
+
+    def _submit(self, shard, batch):
+        try:
+            return self._shards[shard].submit(_run_shard, batch)
+        except BrokenProcessPool:
+            self._shards[shard] = self._new_pool()
+            return self._shards[shard].submit(_run_shard, batch)
+
+    # Returns one TransactionResult per pair, in the same order as `pairs`.
+    def process_batch(self, pairs):
+        pairs = list(pairs)
+        positions = [[] for _ in self._shards]
+        batches = [[] for _ in self._shards]
+        for position, (customer_data, payment_data) in enumerate(pairs):
+            shard = shard_of(customer_data, len(self._shards))
+            positions[shard].append(position)
+            batches[shard].append((customer_data, payment_data))
+
+        futures = [
+            (shard, self._submit(shard, batch))
+            for shard, batch in enumerate(batches)
+            if batch
+        ]
+
+        results = [None] * len(pairs)
+        for shard, future in futures:
+            try:
+                shard_results = future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._shards[shard].shutdown(wait=False)
+                    self._shards[shard] = self._new_pool()
+                shard_results = [TransactionResult(error=e) for _ in positions[shard]]
+            for position, result in zip(positions[shard], shard_results):
+                results[position] = result
+
+        to_log = [
+            (*pairs[position], result.charge)
+            for position, result in enumerate(results)
+            if result.ok
+        ]
+        if to_log:
+            try:
+                self.logger.log_batch(to_log)
+            except Exception as e:
+                for result in results:
+                    if result.ok:
+                        result.log_error = e
+        return results
+
+    # Processes an iterable of pairs in batches of batch_size and yields the results in order.
+    def process_stream(self, pairs, batch_size=10000):
+        batch = []
+        for pair in pairs:
+            batch.append(pair)
+            if len(batch) >= batch_size:
+                yield from self.process_batch(batch)
+                batch = []
+        if batch:
+            yield from self.process_batch(batch)
+
+    def close(self):
+        for pool in self._shards:
+            pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    class _CrashingValidation(CustomerValidation):
+        def validate(self, customer_data):
+            if customer_data["name"] == "Crash":
+                os._exit(1)
+            super().validate(customer_data)
+
+    def _crashing_service_factory():
+        service = default_service_factory()
+        service.customer_validator = _CrashingValidation()
+        return service
+
+    customers = [
+        {"name": f"Customer {number}", "contact_info": {"email": f"c{number}@mail.com"}}
+        for number in range(8)
+    ]
+    pairs = [
+        (customers[number % len(customers)], {"amount": number + 1, "source": "tok_mastercard"})
+        for number in range(32)
+    ]
+    pairs.append(({"name": "", "contact_info": {}}, {"amount": 1, "source": "tok_visa"}))
+
+    with ShardedPaymentExecutor(workers=4) as executor:
+        results = executor.process_batch(pairs)
+
+    print(sum(result.ok for result in results), "succeeded,", sum(not result.ok for result in results), "failed")
+    print([result.charge["amount"] for result in results if result.ok] == list(range(1, 33)))
+
+    # The worker of one shard dies: its items fail, the other shards are charged and logged,
+    # and the shard works again for the next batch.
+    with ShardedPaymentExecutor(service_factory=_crashing_service_factory, workers=4) as executor:
+        results = executor.process_batch(pairs[:32] + [({"name": "Crash"}, pairs[0][1])])
+        failed = [result for result in results if not result.ok]
+        print(sum(result.ok for result in results), "succeeded,", len(failed), "failed:", type(failed[0].error).__name__)
+        results = executor.process_batch(pairs[:32])
+        print(sum(result.ok for result in results), "succeeded after the shard was replaced")
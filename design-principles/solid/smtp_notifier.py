@@ -0,0 +1,234 @@
+### --- Pooled SMTP Email Notifier --- ###
+
+# a_initial_code.py and b_srp.py show the intended delivery:
+#   server = smtplib.SMTP("localhost"); server.send_message(msg); server.quit()
+# that is one TCP + SMTP handshake (and login) for every email.
+
+# SMTPConnectionPool keeps up to `size` open (and logged in) connections and lends them out:
+# - a connection idle for more than `check_after` seconds is checked with NOOP before use
+# - a connection older than `max_age` seconds, or that sent `max_messages` emails, is
+#   closed and replaced (recycled)
+# - a connection that fails while sending is discarded instead of returned to the pool; so is
+#   one whose server answered 421 or more (smtplib closes the socket itself on 421)
+
+# SMTPEmailNotifier is an EmailNotifier (c_ocp.py) that sends the real message through the pool.
+# send_confirmations() sends several messages over one connection, one after the other,
+# without a new handshake between them; when the connection reaches max_messages it is
+# recycled and the rest of the batch goes over a new one.
+
+# StandInSMTPServer is a tiny local SMTP server that stores the messages it receives,
+# so the notifier can be tried without a real mail server (see the __main__ block).
+
+import smtplib
+import socketserver
+import threading
+import time
+from dataclasses import dataclass, field
+from email.mime.text import MIMEText
+from c_ocp import EmailNotifier
+from events import emit, INFO
+
+
+@dataclass
+class PooledConnection:
+    smtp: smtplib.SMTP
+    created_at: float
+    last_used: float
+    messages_sent: int = 0
+
+
+@dataclass
+class SMTPConnectionPool:
+    host: str = "localhost"
+    port: int = 25
+    username: str = None
+    password: str = None
+    starttls: bool = False
+    size: int = 4
+    timeout: float = 10.0
+    check_after: float = 30.0
+    max_age: float = 300.0
+    max_messages: int = 1000
+
+    _idle: list = field(init=False, repr=False, default_factory=list)
+    _slots: threading.Semaphore = field(init=False, repr=False, default=None)
+    _lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+
+    def __post_init__(self):
+        self._slots = threading.Semaphore(self.size)
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    return self._connect()
+                if self._is_healthy(connection):
+                    return connection
+                self._close(connection)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, connection, broken=False):
+        try:
+            now = time.monotonic()
+            if (
+                broken
+                or now - connection.created_at > self.max_age
+                or connection.messages_sent >= self.max_messages
+            ):
+                self._close(connection)
+            else:
+                connection.last_used = now
+                with self._lock:
+                    self._idle.append(connection)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self._close(connection)
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        now = time.monotonic()
+        return PooledConnection(smtp=smtp, created_at=now, last_used=now)
+
+    def _is_healthy(self, connection):
+        now = time.monotonic()
+        if now - connection.created_at > self.max_age:
+            return False
+        if now - connection.last_used < self.check_after:
+            return True
+        try:
+            return connection.smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.smtp.close()
+
+
+@dataclass
+class SMTPEmailNotifier(EmailNotifier):
+    pool: SMTPConnectionPool = field(default_factory=SMTPConnectionPool)
+    sender: str = "no-reply@example.com"
+
+    def send_confirmation(self, customer_data):
+        self.send_confirmations([customer_data])
+
+    # Sends all the confirmations over a single pooled connection.
+    def send_confirmations(self, customers):
+        connection = self.pool.acquire()
+        broken = False
+        try:
+            for customer_data in customers:
+                if connection.messages_sent >= self.pool.max_messages:
+                    self.pool.release(connection)
+                    connection = None
+                    connection = self.pool.acquire()
+                connection.smtp.send_message(self._build_message(customer_data))
+                connection.messages_sent += 1
+                emit(INFO, "email_sent", "Email sent to {email}", email=customer_data["contact_info"]["email"])
+        except (smtplib.SMTPServerDisconnected, OSError):
+            broken = True
+            raise
+        except smtplib.SMTPResponseException as e:
+            broken = e.smtp_code >= 421
+            raise
+        finally:
+            if connection is not None:
+                self.pool.release(connection, broken=broken)
+
+    def _build_message(self, customer_data):
+        msg = MIMEText("Thank you for your payment.")
+        msg["Subject"] = "Payment Confirmation"
+        msg["From"] = self.sender
+        msg["To"] = customer_data["contact_info"]["email"]
+        return msg
+
+
+class _StandInSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 stand-in ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip().upper()
+
+            if command.startswith("EHLO"):
+                self.wfile.write(b"250-stand-in\r\n250 PIPELINING\r\n")
+            elif command.startswith(("HELO", "MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                for data_line in self.rfile:
+                    if data_line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(data_line)
+                self.server.messages.append(b"".join(lines))
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _StandInSMTPHandler)
+        self.messages = []
+        self.connections = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    server = StandInSMTPServer().start()
+    notifier = SMTPEmailNotifier(pool=SMTPConnectionPool(port=server.port, size=2, max_messages=4))
+
+    customer_data_with_email = {
+        "name": "John Doe",
+        "contact_info": {"email": "e@mail.com"},
+    }
+
+    for _ in range(5):
+        notifier.send_confirmation(customer_data_with_email)
+    notifier.send_confirmations([customer_data_with_email] * 5)
+
+    notifier.pool.close()
+    server.stop()
+    print(len(server.messages), "messages over", server.connections, "connection(s)")